@@ -0,0 +1,373 @@
+"""Benchmarks of the scheduling hot paths, no database required.
+
+Covers recurrence expansion, per-day slot computation, splitting ranges
+into days and date iteration on synthetic doctors with dense and sparse
+schedules over 30 to 730 days, plus 10k-occurrence workloads reporting
+peak memory next to timings. Cases call the public functions of
+src.utils which AppointmentService computes schedules with.
+
+    python benchmarks/scheduling.py --save benchmarks/baseline.json
+    python benchmarks/scheduling.py --check
+
+Fastest timings are compared with benchmarks/baseline.json, or
+--baseline, and cases slower by more than --tolerance are reported. With
+--check the run exits with status 1 on such regressions, which is only
+meaningful against a baseline saved on the same machine.
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+import typing as t
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "src")]
+
+# Settings are required at import time, none of them is used to connect.
+for name, value in {
+    "APP_NAME": "benchmarks",
+    "APP_HOST": "127.0.0.1",
+    "APP_PORT": "8000",
+    "APP_WORKERS": "1",
+    "POSTGRES_USER": "benchmarks",
+    "POSTGRES_PASSWORD": "benchmarks",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_HOST": "127.0.0.1",
+    "POSTGRES_DB": "benchmarks",
+    "POSTGRES_ECHO": "0",
+    "SCHEDULE_FOR_DAYS": "730",
+}.items():
+    os.environ.setdefault(name, value)
+
+from src.schemas.appointment import (  # noqa: E402
+    CreateAppointment,
+    Interval,
+    ScheduleType,
+    WeekDay,
+)
+from src.schemas.doctors import DoctorInDB  # noqa: E402
+from src.utils.dates import iterate_between_dates  # noqa: E402
+from src.utils.recurrence import (  # noqa: E402
+    has_intersections,
+    iter_occurrences_between,
+)
+from src.utils.slots import (  # noqa: E402
+    calculate_slots,
+    split_ranges_by_intervals,
+)
+
+HORIZONS = (30, 90, 365, 730)
+OCCURRENCES = 10_000
+START_DATE = dt.date(2030, 1, 1)
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+DOCTORS = {
+    "day": (dt.time(9), dt.time(17)),
+    "overnight": (dt.time(22), dt.time(6)),
+    "round_the_clock": (dt.time(0), dt.time(0)),
+}
+
+RULES = {
+    ScheduleType.weekday: CreateAppointment(
+        doctor_id=1,
+        patient_name="benchmark",
+        schedule_type=ScheduleType.weekday,
+        date=START_DATE,
+        day_of_week=WeekDay.tuesday,
+        day_of_month=None,
+        week_number=None,
+        start_at=dt.time(10),
+        duration=dt.timedelta(minutes=30),
+    ),
+    ScheduleType.monthly: CreateAppointment(
+        doctor_id=1,
+        patient_name="benchmark",
+        schedule_type=ScheduleType.monthly,
+        date=START_DATE,
+        day_of_week=None,
+        day_of_month=15,
+        week_number=None,
+        start_at=dt.time(10),
+        duration=dt.timedelta(minutes=30),
+    ),
+    ScheduleType.monthly_weekday: CreateAppointment(
+        doctor_id=1,
+        patient_name="benchmark",
+        schedule_type=ScheduleType.monthly_weekday,
+        date=START_DATE,
+        day_of_week=WeekDay.friday,
+        day_of_month=None,
+        week_number=3,
+        start_at=dt.time(10),
+        duration=dt.timedelta(minutes=30),
+    ),
+}
+
+
+def make_doctor(name: str) -> DoctorInDB:
+    start_at, end_at = DOCTORS[name]
+    return DoctorInDB(
+        id=1,
+        name=name,
+        summary=None,
+        max_session_duration=dt.timedelta(hours=2),
+        available_time_start=start_at,
+        available_time_end=end_at,
+        created_at=dt.datetime(2030, 1, 1),
+        updated_at=dt.datetime(2030, 1, 1),
+    )
+
+
+def make_schedule(
+    doctor: DoctorInDB,
+    days: int,
+    dense: bool,
+) -> dict[dt.date, list[Interval]]:
+    """Builds appointments grouped by date like the repository does.
+
+    Dense schedules book 15 minutes of every half an hour of working time,
+    sparse ones book two appointments a day.
+    """
+    schedule: dict[dt.date, list[Interval]] = {}
+    step = dt.timedelta(minutes=30 if dense else 240)
+    for date in iterate_between_dates(START_DATE, START_DATE + dt.timedelta(days)):
+        start_at = dt.datetime.combine(
+            date, doctor.available_time_start, tzinfo=dt.timezone.utc
+        )
+        count = 16 if dense else 2
+        for index in range(count):
+            appointment_start_at = start_at + step * index
+            schedule.setdefault(appointment_start_at.date(), []).append(
+                {
+                    "start_at": appointment_start_at,
+                    "end_at": appointment_start_at + dt.timedelta(minutes=15),
+                }
+            )
+    return schedule
+
+
+class Bench:
+    """Collects named cases, each timed as the fastest of several runs.
+
+    A run calls the case in a loop lasting at least 0.2 seconds, so that
+    microsecond cases are not dominated by timer resolution and jitter.
+    """
+
+    def __init__(self, repeat: int, pattern: str | None):
+        self.repeat = repeat
+        self.pattern = pattern
+        self.results: dict[str, dict[str, float]] = {}
+
+    def run(
+        self,
+        name: str,
+        func: t.Callable[[], t.Any],
+        memory: bool = False,
+    ) -> None:
+        """Times func, with memory also reports peak allocations of a call."""
+        if self.pattern is not None and self.pattern not in name:
+            return
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()  # Also warms up.
+        timings = [
+            timing / number
+            for timing in timer.repeat(repeat=self.repeat, number=number)
+        ]
+        self.results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+        }
+        line = f"{name:<60} {min(timings) * 1000:>10.3f} ms"
+        if memory:
+            # Traced separately as tracing slows allocations down.
+            tracemalloc.start()
+            try:
+                func()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.results[name]["peak_bytes"] = peak
+            line += f" {peak / 1024:>10.1f} KiB"
+        print(line)
+
+
+def bench_recurrence(bench: Bench) -> None:
+    since = dt.datetime.combine(START_DATE, dt.time.min, tzinfo=dt.timezone.utc)
+    for schedule_type, rule in RULES.items():
+        for days in HORIZONS:
+            until = since + dt.timedelta(days=days)
+            bench.run(
+                f"recurrence/{schedule_type.value}/{days}d",
+                lambda: list(iter_occurrences_between(rule, since, until)),
+            )
+
+
+def bench_slots(bench: Bench) -> None:
+    for doctor_name in DOCTORS:
+        doctor = make_doctor(doctor_name)
+        for dense in (False, True):
+            schedule = make_schedule(doctor, 1, dense)
+            density = "dense" if dense else "sparse"
+            bench.run(
+                f"slots/{doctor_name}/{density}",
+                lambda: calculate_slots(
+                    date=START_DATE,
+                    available_start_at=doctor.available_time_start,
+                    available_end_at=doctor.available_time_end,
+                    scheduled=schedule.get(START_DATE, []),
+                ),
+            )
+
+
+def bench_split_ranges(bench: Bench) -> None:
+    for doctor_name in DOCTORS:
+        doctor = make_doctor(doctor_name)
+        for dense in (False, True):
+            density = "dense" if dense else "sparse"
+            for days in HORIZONS:
+                schedule = make_schedule(doctor, days, dense)
+                until = START_DATE + dt.timedelta(days=days)
+                bench.run(
+                    f"split_ranges/{doctor_name}/{density}/{days}d",
+                    lambda: split_ranges_by_intervals(
+                        since=START_DATE,
+                        until=until,
+                        available_start_at=doctor.available_time_start,
+                        available_end_at=doctor.available_time_end,
+                        appointments=schedule,
+                    ),
+                )
+
+
+def bench_occurrences(bench: Bench) -> None:
+    rule = RULES[ScheduleType.weekday]
+    since = dt.datetime.combine(START_DATE, dt.time.min, tzinfo=dt.timezone.utc)
+    until = since + dt.timedelta(weeks=OCCURRENCES)
+    bench.run(
+        "occurrences/10k/expand",
+        lambda: list(iter_occurrences_between(rule, since, until)),
+        memory=True,
+    )
+    occurrences = list(iter_occurrences_between(rule, since, until))
+    # Same weekday an hour later, scanned to the end without overlaps.
+    shifted = [
+        type(occurrence)(
+            start_at=occurrence.start_at + dt.timedelta(hours=1),
+            end_at=occurrence.end_at + dt.timedelta(hours=1),
+        )
+        for occurrence in occurrences
+    ]
+    bench.run(
+        "occurrences/10k/intersections",
+        lambda: has_intersections(occurrences, shifted),
+    )
+
+
+def bench_dates(bench: Bench) -> None:
+    for days in HORIZONS:
+        until = START_DATE + dt.timedelta(days=days)
+        bench.run(
+            f"iterate_between_dates/{days}d",
+            lambda: sum(1 for _ in iterate_between_dates(START_DATE, until)),
+        )
+
+
+BENCHMARKS = (
+    bench_recurrence,
+    bench_slots,
+    bench_split_ranges,
+    bench_occurrences,
+    bench_dates,
+)
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """Returns names of cases slower than baseline beyond tolerance."""
+    regressions = []
+    print(f"\n{'case':<60} {'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(f"{name:<60} {ratio:>8.2f}{mark}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-k", dest="pattern", help="Run cases containing it.")
+    parser.add_argument("--save", type=Path, help="Write results as JSON.")
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE,
+        help="Compare with results, skipped when the file does not exist.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown relatively to baseline, 0.2 means 20%%.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 on regressions.",
+    )
+    args = parser.parse_args()
+
+    # Read first, --save may overwrite the baseline.
+    baseline = None
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        recorded_on = (baseline["python"], baseline["machine"])
+        if recorded_on != (platform.python_version(), platform.machine()):
+            print(
+                "Baseline was recorded with Python {} on {}, "
+                "ratios are only indicative.\n".format(*recorded_on)
+            )
+
+    bench = Bench(repeat=args.repeat, pattern=args.pattern)
+    for benchmark in BENCHMARKS:
+        benchmark(bench)
+
+    if args.save is not None:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "created_at": dt.datetime.now(tz=dt.timezone.utc).isoformat(),
+                    "results": bench.results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+    if baseline is not None:
+        regressions = compare(bench.results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed.")
+            if args.check:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
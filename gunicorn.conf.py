@@ -0,0 +1,23 @@
+"""Production launcher, run with ``gunicorn main:app`` from the project root.
+
+The app is imported once in the master and forked into APP_WORKERS uvicorn
+workers. Every worker creates its own database engine after fork, pools
+are sized by POSTGRES_MAX_CONNECTIONS. ``kill -HUP`` restarts workers
+gracefully, application code changes require a full restart because of
+the preloading.
+"""
+
+from src.core.config import settings
+
+pythonpath = "src"
+bind = f"{settings.APP_HOST}:{settings.APP_PORT}"
+workers = settings.APP_WORKERS
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+graceful_timeout = settings.APP_GRACEFUL_TIMEOUT
+
+
+def post_fork(server, worker):
+    from src.core.db import sessionmanager
+
+    sessionmanager.reinit_after_fork()
@@ -3,7 +3,12 @@ from uuid import UUID
 import typing as t
 from pydantic import Field, field_validator, model_validator
 
-from schemas.appointment import ScheduleType, WeekDay
+from schemas.appointment import (
+    MAX_APPOINTMENT_DURATION,
+    BulkItemStatus,
+    ScheduleType,
+    WeekDay,
+)
 from src.api.dto.base import FrontendModelBase
 
 
@@ -31,6 +36,14 @@ class CreateAppointmentRule(FrontendModelBase):
             return v
         raise ValueError(f"Date must be more than {dt.date.today()}")
 
+    @field_validator("duration")
+    def validate_duration(cls, v: dt.timedelta) -> dt.timedelta:
+        if dt.timedelta(0) < v <= MAX_APPOINTMENT_DURATION:
+            return v
+        raise ValueError(
+            f"Duration must be positive and not exceed {MAX_APPOINTMENT_DURATION}"
+        )
+
     @model_validator(mode="after")
     def check_schedule_type(self) -> t.Any:
         if self.schedule_type == ScheduleType.sole and self.date is None:
@@ -39,15 +52,14 @@ class CreateAppointmentRule(FrontendModelBase):
             raise ValueError("Date cannot be None for weekly appointment.")
         if self.schedule_type == ScheduleType.monthly and self.day_of_month is None:
             raise ValueError("Day of month cannot be None " "for monthly appointment.")
-        if (
-            self.schedule_type == ScheduleType.monthly_weekday
-            and self.day_of_week is None
-            or self.week_number is None
+        if self.schedule_type == ScheduleType.monthly_weekday and (
+            self.day_of_week is None or self.week_number is None
         ):
             raise ValueError(
                 "day_of_week and week_number cannot be "
                 "None for monthly_weekday appointment."
             )
+        return self
 
 
 class CreateAppointmentResponse(FrontendModelBase):
@@ -62,3 +74,28 @@ class CreateAppointmentResponse(FrontendModelBase):
     start_at: dt.time
     duration: dt.timedelta
     created_at: dt.datetime
+
+
+class BulkCreateAppointmentResponse(FrontendModelBase):
+    index: int
+    status: BulkItemStatus
+    id: UUID | None = None
+
+
+class DoctorSlotResponse(FrontendModelBase):
+    doctor_id: int
+    start_at: dt.datetime
+    end_at: dt.datetime
+
+
+class AppointmentConflictResponse(FrontendModelBase):
+    appointment_rule_id: UUID
+    start_at: dt.datetime
+    end_at: dt.datetime
+
+
+class QuoteAppointmentResponse(FrontendModelBase):
+    start_at: dt.datetime
+    end_at: dt.datetime
+    available: bool
+    conflicts: list[AppointmentConflictResponse]
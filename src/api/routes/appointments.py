@@ -1,13 +1,30 @@
+import dataclasses
 import datetime as dt
+import hashlib
+import json
+import typing as t
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from core.db import get_db_session
-from src.api.dto.appointments import CreateAppointmentRule
-from src.schemas.appointment import CreateAppointment
+from src.api.dto.appointments import (
+    BulkCreateAppointmentResponse,
+    CreateAppointmentRule,
+    DoctorSlotResponse,
+    QuoteAppointmentResponse,
+)
+from src.core.db import get_db_read_session, get_db_session, sessionmanager
+from src.schemas.appointment import (
+    MAX_APPOINTMENT_DURATION,
+    CreateAppointment,
+    SlotGranularity,
+)
 from src.service.appointments import AppointmentService
+from src.service.coalescer import booking_coalescer
+from src.service.doctors import DoctorService
+from src.service.locks import lock_doctors
 
 router = APIRouter(
     prefix="/appointments",
@@ -25,27 +42,211 @@ async def create_appointment(
     db: AsyncSession = Depends(get_db_session),
 ):
     create_appointment_data = CreateAppointment(**data.dict())
-    appointment = await AppointmentService(db=db).create_appointment(
-        data=create_appointment_data,
-    )
-    await db.commit()
+    if booking_coalescer is not None:
+        return await booking_coalescer.create_appointment(create_appointment_data)
+    async with lock_doctors(db, [data.doctor_id]):
+        appointment = await AppointmentService(db=db).create_appointment(
+            data=create_appointment_data,
+        )
+        await db.commit()
     return appointment
 
 
+@router.post(
+    path="/quote",
+    summary="Check an appointment rule without creating it",
+    status_code=status.HTTP_200_OK,
+)
+async def quote_appointment(
+    data: CreateAppointmentRule,
+    db: AsyncSession = Depends(get_db_read_session),
+) -> list[QuoteAppointmentResponse]:
+    quote = await AppointmentService(db=db).quote_appointment(
+        data=CreateAppointment(**data.dict()),
+    )
+    return [
+        QuoteAppointmentResponse(
+            **dataclasses.asdict(item),
+            available=not item.conflicts,
+        )
+        for item in quote
+    ]
+
+
+@router.post(
+    path="/bulk",
+    summary="Create many appointment rules at once",
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_appointments_bulk(
+    data: t.Annotated[list[CreateAppointmentRule], Body(max_length=1000)],
+    db: AsyncSession = Depends(get_db_session),
+) -> list[BulkCreateAppointmentResponse]:
+    async with lock_doctors(db, (item.doctor_id for item in data)):
+        results = await AppointmentService(db=db).create_appointments_bulk(
+            items=[CreateAppointment(**item.dict()) for item in data],
+        )
+        await db.commit()
+    return [
+        BulkCreateAppointmentResponse(
+            index=result.index,
+            status=result.status,
+            id=result.appointment.id if result.appointment else None,
+        )
+        for result in results
+    ]
+
+
 @router.get(
     path="/free-intervals/{doctor_id}",
     summary="List appointment free intervals.",
     status_code=status.HTTP_201_CREATED,
 )
 async def get_free_intervals(
+    response: Response,
     doctor_id: int,
     since: dt.date,
     until: dt.date,
-    db: AsyncSession = Depends(get_db_session),
+    granularity: t.Annotated[
+        SlotGranularity,
+        Query(description="Slot duration in minutes."),
+    ] = SlotGranularity.fifteen,
+    min_duration: t.Annotated[
+        dt.timedelta | None,
+        Query(description="Return merged free runs lasting at least this long."),
+    ] = None,
+    stream: t.Annotated[
+        bool,
+        Query(description="Stream one NDJSON line per day."),
+    ] = False,
+    if_none_match: t.Annotated[str | None, Header()] = None,
+    db: AsyncSession = Depends(get_db_read_session),
 ):
+    step = dt.timedelta(minutes=granularity)
+    # Whole numbers of slots up to the longest appointment keep the variants
+    # of cached free intervals bounded.
+    if min_duration is not None and not (
+        dt.timedelta(0) < min_duration <= MAX_APPOINTMENT_DURATION
+        and min_duration % step == dt.timedelta(0)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="min_duration must be a multiple of granularity up to a day.",
+        )
+    # Checked first, so that If-None-Match: * is not answered for unknown
+    # doctors. Doctor profiles are cached, this stays cheap.
+    await DoctorService(db=db).get_doctor(
+        doctor_id=doctor_id,
+        raise_exception=True,
+    )
+    service = AppointmentService(db=db)
+    version = await service.get_schedule_version(doctor_id)
+    # The window is clamped to today and the booking horizon, both move
+    # with the date.
+    etag = _make_etag(
+        doctor_id,
+        version,
+        since,
+        until,
+        granularity,
+        min_duration,
+        stream,
+        dt.datetime.now(tz=dt.timezone.utc).date(),
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return await AppointmentService(db=db).get_free_intervals(
+    if stream is True:
+        return StreamingResponse(
+            _stream_free_intervals(
+                doctor_id=doctor_id,
+                since=since,
+                until=until,
+                granularity=step,
+                min_duration=min_duration,
+                replica=db.info.get("replica", False),
+            ),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+
+    intervals = await service.get_free_intervals(
         doctor_id=doctor_id,
         until=until,
         since=since,
+        granularity=step,
+        min_duration=min_duration,
+        version=version,
+    )
+    response.headers.update(headers)
+    return intervals
+
+
+def _make_etag(doctor_id: int, version: int, *params: t.Any) -> str:
+    digest = hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()
+    return f'"{doctor_id}-{version}-{digest}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    # Weak comparison, as If-None-Match is defined to use.
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+async def _stream_free_intervals(
+    doctor_id: int,
+    since: dt.date,
+    until: dt.date,
+    granularity: dt.timedelta,
+    min_duration: dt.timedelta | None,
+    replica: bool,
+) -> t.AsyncIterator[str]:
+    # The request session is closed before the response is sent,
+    # so the stream holds its own one on the same database.
+    open_session = sessionmanager.read_session if replica else sessionmanager.session
+    async with open_session() as db:
+        days = AppointmentService(db=db).iter_free_intervals(
+            doctor_id=doctor_id,
+            since=since,
+            until=until,
+            granularity=granularity,
+            min_duration=min_duration,
+        )
+        async for date, intervals in days:
+            line = {
+                "date": date.isoformat(),
+                "intervals": [
+                    {
+                        "start_at": interval["start_at"].isoformat(),
+                        "end_at": interval["end_at"].isoformat(),
+                    }
+                    for interval in intervals
+                ],
+            }
+            yield json.dumps(line) + "\n"
+
+
+@router.get(
+    path="/earliest-slots",
+    summary="Find the earliest free slots among many doctors.",
+    status_code=status.HTTP_200_OK,
+)
+async def find_earliest_slots(
+    doctor_ids: t.Annotated[list[int], Query(min_length=1, max_length=100)],
+    duration: dt.timedelta,
+    since: dt.date,
+    until: dt.date,
+    limit: t.Annotated[int, Query(ge=1, le=50)] = 1,
+    db: AsyncSession = Depends(get_db_read_session),
+) -> list[DoctorSlotResponse]:
+    slots = await AppointmentService(db=db).find_earliest_slots(
+        doctor_ids=doctor_ids,
+        duration=duration,
+        since=since,
+        until=until,
+        limit=limit,
     )
+    return [DoctorSlotResponse(**dataclasses.asdict(slot)) for slot in slots]
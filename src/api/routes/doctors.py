@@ -1,19 +1,23 @@
+import datetime as dt
+import typing as t
 from dataclasses import asdict
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from service.doctors import DoctorService
 from src.api.dto.doctors import CreateDoctorRequest, DoctorDetailsResponse
-from src.core.db import get_db_session
-from src.schemas.doctors import CreateDoctor
+from src.core.db import get_db_read_session, get_db_session
+from src.schemas.doctors import CreateDoctor, DoctorFilter
 
 router = APIRouter(
     prefix="/doctors",
     tags=["doctors"],
 )
 
+NEXT_AFTER_ID_HEADER = "X-Next-After-Id"
+
 
 @router.post(
     path="/",
@@ -37,7 +41,7 @@ async def create_doctor(
 )
 async def get_doctor(
     doctor_id: int,
-    db: AsyncSession = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_read_session),
 ) -> DoctorDetailsResponse:
     doctor = await DoctorService(db=db).get_doctor(
         doctor_id=doctor_id,
@@ -48,11 +52,32 @@ async def get_doctor(
 
 @router.get(
     path="/",
-    summary="List all doctors",
+    summary="List doctors page by page",
     status_code=status.HTTP_200_OK,
 )
 async def list_doctors(
-    db: AsyncSession = Depends(get_db_session),
+    response: Response,
+    after_id: int | None = None,
+    limit: t.Annotated[int, Query(ge=1, le=500)] = 50,
+    available_from: dt.time | None = None,
+    available_until: dt.time | None = None,
+    min_session_duration: dt.timedelta | None = None,
+    db: AsyncSession = Depends(get_db_read_session),
 ) -> list[DoctorDetailsResponse]:
-    doctors = await DoctorService(db=db).list_doctors()
+    """Lists doctors ordered by id.
+
+    Pass the id of the last doctor as `after_id` to get the next page, it is
+    also returned in the `X-Next-After-Id` header while more pages remain.
+    """
+    doctors = await DoctorService(db=db).list_doctors(
+        after_id=after_id,
+        limit=limit,
+        filters=DoctorFilter(
+            available_from=available_from,
+            available_until=available_until,
+            min_session_duration=min_session_duration,
+        ),
+    )
+    if len(doctors) == limit:
+        response.headers[NEXT_AFTER_ID_HEADER] = str(doctors[-1].id)
     return [DoctorDetailsResponse(**asdict(doctor)) for doctor in doctors]
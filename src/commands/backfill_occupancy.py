@@ -0,0 +1,42 @@
+"""Builds doctor_day_occupancy from stored appointments.
+
+Run once before switching FREE_INTERVALS_BACKEND to "occupancy", later
+writes keep the table current. Rerunning recomputes it from scratch, the
+doctors of a batch are rebuilt in one transaction:
+
+    python -m src.commands.backfill_occupancy
+"""
+
+import asyncio
+
+from sqlalchemy import select
+
+from src.core.db import sessionmanager
+from src.db.models import Doctor
+from src.repo.occupancy import OccupancyRepo
+
+BATCH_SIZE = 100
+
+
+async def main() -> None:
+    after_id = 0
+    while True:
+        async with sessionmanager.session() as db:
+            doctor_ids = list(
+                await db.scalars(
+                    select(Doctor.id)
+                    .where(Doctor.id > after_id)
+                    .order_by(Doctor.id)
+                    .limit(BATCH_SIZE)
+                )
+            )
+            if not doctor_ids:
+                break
+            await OccupancyRepo(db=db).rebuild(doctor_ids=doctor_ids)
+            await db.commit()
+        after_id = doctor_ids[-1]
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
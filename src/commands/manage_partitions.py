@@ -0,0 +1,49 @@
+"""Maintains monthly partitions of appointments.
+
+Web workers create upcoming partitions on startup and before every
+background materialization pass. With the materializer disabled run
+``ensure`` periodically, e.g. from cron. ``detach`` takes months ending
+before the date out of the table, leaving them as standalone tables
+``appointments_pYYYYMM`` to dump and drop, or dropping them with --drop
+(both the project root and src/ must be on PYTHONPATH):
+
+    python -m src.commands.manage_partitions ensure
+    python -m src.commands.manage_partitions detach --before 2024-01-01
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+
+from src.core.db import sessionmanager
+from src.service.partitions import PartitionService
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="Create upcoming partitions.")
+    ensure.add_argument("--until", type=dt.date.fromisoformat)
+    detach = commands.add_parser("detach", help="Detach old partitions.")
+    detach.add_argument("--before", type=dt.date.fromisoformat, required=True)
+    detach.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    async with sessionmanager.session() as db:
+        service = PartitionService(db=db)
+        if args.command == "ensure":
+            months = await service.ensure_partitions(until=args.until)
+            names = [f"{month:%Y-%m}" for month in months]
+        else:
+            names = await service.detach_partitions(
+                before=args.before,
+                drop=args.drop,
+            )
+        await db.commit()
+    await sessionmanager.close()
+    for name in names:
+        print(name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+"""Stores upcoming occurrences of recurring rules.
+
+Web workers do it in the background every APPOINTMENT_MATERIALIZER_INTERVAL
+seconds. With that disabled run it periodically, e.g. from cron (both the
+project root and src/ must be on PYTHONPATH):
+
+    python -m src.commands.materialize_appointments
+
+A pass running in a web worker or another command at the same time is
+left to finish alone.
+"""
+
+import asyncio
+import datetime as dt
+
+from src.core.config import settings
+from src.core.db import sessionmanager
+from src.service.materializer import AppointmentMaterializer
+
+
+async def main() -> None:
+    materializer = AppointmentMaterializer(
+        interval=settings.APPOINTMENT_MATERIALIZER_INTERVAL,
+        batch_size=settings.APPOINTMENT_MATERIALIZER_BATCH_SIZE,
+        chunk=dt.timedelta(days=settings.APPOINTMENT_MATERIALIZER_CHUNK_DAYS),
+        batch_delay=settings.APPOINTMENT_MATERIALIZER_BATCH_DELAY,
+    )
+    await materializer.materialize()
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,6 @@
+import typing as t
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -13,6 +16,8 @@ class Settings(BaseSettings):
     APP_HOST: str
     APP_PORT: int
     APP_WORKERS: int
+    # Seconds given to workers to finish requests on restart or shutdown.
+    APP_GRACEFUL_TIMEOUT: int = 30
 
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
@@ -20,13 +25,91 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_DB: str
     POSTGRES_ECHO: int
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    # Connections all workers may open together, pools are shrunk to fit.
+    POSTGRES_MAX_CONNECTIONS: int | None = None
+    # Seconds after which a connection is replaced, -1 keeps it forever.
+    POSTGRES_POOL_RECYCLE: int = -1
+    POSTGRES_POOL_PRE_PING: bool = False
+    # Connections opened on startup, at most POSTGRES_POOL_SIZE.
+    POSTGRES_POOL_WARMUP: int = 5
+    # Executions of the same query before psycopg prepares it on the server,
+    # unset disables prepared statements (e.g. behind PgBouncer).
+    POSTGRES_PREPARE_THRESHOLD: int | None = 2
+    # Streaming replica serving read-only endpoints, with the credentials
+    # and the database of the primary. Unset sends reads to the primary.
+    POSTGRES_REPLICA_HOST: str | None = None
+    POSTGRES_REPLICA_PORT: str | None = None
 
     SCHEDULE_FOR_DAYS: int
+    # Bookings of a doctor are serialized by a Postgres advisory lock, or by
+    # an in-process lock ("local") which is only safe with a single worker.
+    BOOKING_LOCK: t.Literal["advisory", "local"] = "advisory"
+    BOOKING_LOCK_TIMEOUT: float = 5
+    BOOKING_LOCK_RETRY_DELAY: float = 0.01
+    # Single bookings arriving within this window are created together,
+    # 0 disables coalescing.
+    BOOKING_COALESCE_WINDOW_MS: int = 0
+    BOOKING_COALESCE_MAX_BATCH: int = 100
+    # Recurring rules store occurrences only this many days ahead and
+    # generate later ones on demand. Unset means the whole schedule.
+    # Occurrences past the stored horizon are not covered by the exclusion
+    # constraint, overlaps with them are only prevented by the advisory
+    # booking lock, so BOOKING_LOCK must be "advisory" when this is set.
+    APPOINTMENT_MATERIALIZE_DAYS: int | None = None
+    # Seconds between background passes storing occurrences as the horizon
+    # moves, 0 disables them. A pass extends rules by CHUNK_DAYS per batch
+    # of BATCH_SIZE doctors and sleeps BATCH_DELAY seconds between batches.
+    APPOINTMENT_MATERIALIZER_INTERVAL: float = 300
+    APPOINTMENT_MATERIALIZER_BATCH_SIZE: int = 100
+    APPOINTMENT_MATERIALIZER_CHUNK_DAYS: int = 7
+    APPOINTMENT_MATERIALIZER_BATCH_DELAY: float = 0.1
+    # Monthly partitions of appointments are created this many months past
+    # the booking horizon.
+    APPOINTMENT_PARTITION_MONTHS_AHEAD: int = 1
+
+    # Where free slots are computed: "python", "sql" (generate_series) or
+    # "occupancy" (python over doctor_day_occupancy, backfill it first).
+    FREE_INTERVALS_BACKEND: t.Literal["python", "sql", "occupancy"] = "python"
+    FREE_INTERVALS_CACHE_SIZE: int = 10_000
+    FREE_INTERVALS_CACHE_TTL: int = 300
+    QUOTE_CACHE_SIZE: int = 10_000
+    QUOTE_CACHE_TTL: int = 5
+    DOCTOR_CACHE_SIZE: int = 1_000
+    DOCTOR_CACHE_TTL: int = 600
+
+    @model_validator(mode="after")
+    def check_booking_lock(self) -> t.Self:
+        # In-process locks do not serialize bookings made by other workers.
+        if self.BOOKING_LOCK == "local" and self.APP_WORKERS > 1:
+            raise ValueError("BOOKING_LOCK=local requires APP_WORKERS=1")
+        # Lazy occurrences are checked by application code only, which must
+        # be serialized with the materializer and other processes.
+        if (
+            self.BOOKING_LOCK == "local"
+            and self.APPOINTMENT_MATERIALIZE_DAYS is not None
+        ):
+            raise ValueError(
+                "BOOKING_LOCK=local cannot be used with APPOINTMENT_MATERIALIZE_DAYS"
+            )
+        return self
 
     def get_database_uri(self) -> str:
         return (
             f"postgresql+psycopg://{self.POSTGRES_USER}:"
-            f"{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}"
+            f"{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}"
+            f"/{self.POSTGRES_DB}"
+        )
+
+    def get_replica_database_uri(self) -> str | None:
+        if self.POSTGRES_REPLICA_HOST is None:
+            return None
+        port = self.POSTGRES_REPLICA_PORT or self.POSTGRES_PORT
+        return (
+            f"postgresql+psycopg://{self.POSTGRES_USER}:"
+            f"{self.POSTGRES_PASSWORD}@{self.POSTGRES_REPLICA_HOST}:{port}"
             f"/{self.POSTGRES_DB}"
         )
 
@@ -1,16 +1,23 @@
+import asyncio
 import contextlib
+import time
 import typing as t
 from dataclasses import dataclass
 from typing import Any, AsyncIterator
 
+from fastapi import Header
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from src.core import metrics
 from src.core.config import settings
 
 
@@ -21,27 +28,143 @@ class Base(DeclarativeBase):
         raise NotImplementedError
 
 
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool reporting how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_checkout_wait.observe(time.perf_counter() - started_at)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    started_at = conn.info["query_started_at"].pop()
+    metrics.db_statement_duration.observe(
+        time.perf_counter() - started_at,
+        statement=metrics.get_statement_kind(statement),
+    )
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute.
+    if context.connection is not None:
+        started_at = context.connection.info.get("query_started_at")
+        if started_at:
+            started_at.pop()
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary") -> None:
+    """Reports statement timings and pool occupancy of the engine."""
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    pool = sync_engine.pool
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        gauge = metrics.db_pool_connections
+        gauge.set_function(pool.size, pool=name, state="size")
+        gauge.set_function(pool.checkedout, pool=name, state="checked_out")
+        gauge.set_function(pool.checkedin, pool=name, state="idle")
+        gauge.set_function(lambda: max(pool.overflow(), 0), pool=name, state="overflow")
+
+
 class DatabaseSessionManager:
+    """Engines of the primary database and of an optional read replica.
+
+    Without a replica host read sessions are opened on the primary.
+    """
+
     def __init__(
         self,
         host: str,
         engine_kwargs: dict[str, Any] | None = None,
+        replica_host: str | None = None,
     ):
         if engine_kwargs is None:
             engine_kwargs = {}
-        self._engine = create_async_engine(host, **engine_kwargs)
+        engine_kwargs.setdefault("poolclass", TimedQueuePool)
+        self._host = host
+        self._replica_host = replica_host
+        self._engine_kwargs = engine_kwargs
+        self.init()
+
+    def init(self) -> None:
+        """Creates the engines and the session factories."""
+        self._engine = create_async_engine(self._host, **self._engine_kwargs)
+        instrument_engine(self._engine)
         self._sessionmaker = async_sessionmaker(
             autocommit=False,
             bind=self._engine,
         )
+        self._replica_engine = None
+        self._replica_sessionmaker = None
+        if self._replica_host is not None:
+            self._replica_engine = create_async_engine(
+                self._replica_host, **self._engine_kwargs
+            )
+            instrument_engine(self._replica_engine, name="replica")
+            self._replica_sessionmaker = async_sessionmaker(
+                autocommit=False,
+                bind=self._replica_engine,
+                info={"replica": True},
+            )
+
+    @property
+    def _engines(self) -> list[AsyncEngine]:
+        return [
+            engine
+            for engine in (self._engine, self._replica_engine)
+            if engine is not None
+        ]
+
+    def reinit_after_fork(self) -> None:
+        """Replaces the engines inherited from the parent process.
+
+        Connections of the parent are left open for it, the child gets
+        engines and pools of its own.
+        """
+        for engine in self._engines:
+            engine.sync_engine.dispose(close=False)
+        self.init()
+
+    async def warm_up(self, connections: int) -> None:
+        """Opens connections concurrently and returns them to the pool.
+
+        Connection setup then happens before traffic arrives instead of
+        during the first burst of requests.
+        """
+        if self._engine is None:
+            raise RuntimeError("DatabaseSessionManager is not initialized")
+        opened = []
+        for engine in self._engines:
+            pool = engine.sync_engine.pool
+            count = connections
+            if isinstance(pool, AsyncAdaptedQueuePool):
+                count = min(count, pool.size())
+            opened.extend(engine.connect() for _ in range(count))
+        if not opened:
+            return
+        try:
+            await asyncio.gather(*(connection.start() for connection in opened))
+        finally:
+            await asyncio.gather(*(connection.close() for connection in opened))
 
     async def close(self):
         if self._engine is None:
             raise RuntimeError("DatabaseSessionManager is not initialized")
-        await self._engine.dispose()
+        for engine in self._engines:
+            await engine.dispose()
 
         self._engine = None
         self._sessionmaker = None
+        self._replica_engine = None
+        self._replica_sessionmaker = None
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
@@ -69,13 +192,91 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    @contextlib.asynccontextmanager
+    async def pinned_session(self) -> AsyncIterator[AsyncSession]:
+        """Opens a session keeping a single connection across its commits.
+
+        Session-level advisory locks belong to the connection, so they stay
+        held by such a session until it unlocks them.
+        """
+        if self._engine is None:
+            raise RuntimeError("DatabaseSessionManager is not initialized")
+
+        async with self._engine.connect() as connection:
+            session = AsyncSession(bind=connection)
+            try:
+                yield session
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                await session.close()
+
+    @contextlib.asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        """Opens a session on the replica, or on the primary without one.
+
+        The replica lags behind the primary, reads which must see writes
+        just made go through session instead.
+        """
+        if self._replica_sessionmaker is None:
+            async with self.session() as session:
+                yield session
+            return
+
+        session = self._replica_sessionmaker()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+def get_pool_limits(workers: int) -> dict[str, int]:
+    """Returns pool size and overflow of a worker within the connection budget.
+
+    Each of the workers may open up to pool size plus overflow connections,
+    so both are capped to keep the total within POSTGRES_MAX_CONNECTIONS.
+    """
+    pool_size = settings.POSTGRES_POOL_SIZE
+    max_overflow = settings.POSTGRES_MAX_OVERFLOW
+    if settings.POSTGRES_MAX_CONNECTIONS is not None:
+        per_worker = max(settings.POSTGRES_MAX_CONNECTIONS // max(workers, 1), 1)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(min(max_overflow, per_worker - pool_size), 0)
+    return {"pool_size": pool_size, "max_overflow": max_overflow}
+
 
 sessionmanager = DatabaseSessionManager(
     settings.get_database_uri(),
-    {"echo": settings.POSTGRES_ECHO},
+    {
+        "echo": settings.POSTGRES_ECHO,
+        **get_pool_limits(settings.APP_WORKERS),
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+        "connect_args": {"prepare_threshold": settings.POSTGRES_PREPARE_THRESHOLD},
+    },
+    replica_host=settings.get_replica_database_uri(),
 )
 
 
 async def get_db_session():
     async with sessionmanager.session() as session:
         yield session
+
+
+async def get_db_read_session(
+    x_read_your_writes: t.Annotated[
+        bool,
+        Header(description="Read from the primary to see own recent writes."),
+    ] = False,
+):
+    if x_read_your_writes is True:
+        async with sessionmanager.session() as session:
+            yield session
+    else:
+        async with sessionmanager.read_session() as session:
+            yield session
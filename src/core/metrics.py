@@ -0,0 +1,240 @@
+import bisect
+import functools
+import math
+import time
+import typing as t
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = tuple[str, ...]
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """Base of metrics kept in process and rendered in Prometheus text format.
+
+    Values are per worker process, every worker exposes its own ``/metrics``.
+    """
+
+    type: str
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> t.Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self._samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> t.Iterator[str]:
+        for key, value in self._values.items():
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_total{labels} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Gauge either set explicitly or read from a callback on render."""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[Labels, float] = {}
+        self._callbacks: dict[Labels, t.Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, func: t.Callable[[], float], **labels: str) -> None:
+        self._callbacks[self._key(labels)] = func
+
+    def _samples(self) -> t.Iterator[str]:
+        values = dict(self._values)
+        for key, func in self._callbacks.items():
+            values[key] = func()
+        for key, value in values.items():
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets: t.Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per labels: non-cumulative bucket counts, sum of observations.
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        item = self._values.get(key)
+        if item is None:
+            item = self._values[key] = ([0] * len(self.buckets), [0.0])
+        counts, total = item
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def _samples(self) -> t.Iterator[str]:
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.label_names, key, f'le="{_format_value(bound)}"'
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling HTTP requests.",
+        ("method", "route", "status"),
+    )
+)
+repo_method_duration = registry.register(
+    Histogram(
+        "repo_method_duration_seconds",
+        "Time spent in repository methods.",
+        ("repo", "method"),
+    )
+)
+db_statement_duration = registry.register(
+    Histogram(
+        "db_statement_duration_seconds",
+        "Time spent executing SQL statements.",
+        ("statement",),
+    )
+)
+db_pool_checkout_wait = registry.register(
+    Histogram(
+        "db_pool_checkout_wait_seconds",
+        "Time spent waiting for a connection from the pool.",
+    )
+)
+booking_lock_wait = registry.register(
+    Histogram(
+        "booking_lock_wait_seconds",
+        "Time spent waiting for per-doctor booking locks.",
+        ("backend",),
+    )
+)
+materialized_appointments = registry.register(
+    Counter(
+        "materialized_appointments",
+        "Occurrences of recurring rules stored ahead, or skipped on conflict.",
+        ("result",),
+    )
+)
+db_pool_connections = registry.register(
+    Gauge(
+        "db_pool_connections",
+        "Connections of the pools by state.",
+        ("pool", "state"),
+    )
+)
+
+
+def timed_method(func: t.Callable, repo: str) -> t.Callable:
+    """Wraps a coroutine function to record its duration as a repo method."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            repo_method_duration.observe(
+                time.perf_counter() - started_at,
+                repo=repo,
+                method=func.__name__,
+            )
+
+    wrapper.__timed__ = True
+    return wrapper
+
+
+def get_statement_kind(statement: str) -> str:
+    """Returns the leading SQL keyword, e.g. SELECT or INSERT."""
+    words = statement.lstrip(" \n\t(").split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
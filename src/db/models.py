@@ -1,8 +1,13 @@
 import uuid
-from datetime import datetime, time, timedelta
-
-from sqlalchemy import Date, ForeignKey, String, text
-from sqlalchemy.dialects.postgresql import UUID
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import BigInteger, Computed, Date, ForeignKey, Index, String, text
+from sqlalchemy.dialects.postgresql import (
+    TSMULTIRANGE,
+    TSRANGE,
+    UUID,
+    Range,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.core.db import Base
@@ -29,7 +34,7 @@ class Doctor(Base):
     )
     updated_at: Mapped[datetime] = mapped_column(
         server_default=UTC_DATETIME_NOW,
-        onupdate=True,
+        onupdate=UTC_DATETIME_NOW,
     )
 
     def to_dataclass(self) -> DoctorInDB:
@@ -46,8 +51,27 @@ class Doctor(Base):
 
 
 class ScheduledAppointment(Base):
+    """Stored occurrence of an appointment rule.
+
+    The table is partitioned by month of start_at, partitions are managed
+    by PartitionService. Each of them has an exclusion constraint keeping
+    appointments of a doctor from overlapping, its GiST index also serves
+    conflict lookups. Overlaps with appointments of a neighbouring month
+    are rejected by the appointments_boundary_overlap trigger.
+    """
+
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index(
+            "ix_appointments_doctor_id_start_at_end_at",
+            "doctor_id",
+            "start_at",
+            "end_at",
+        ),
+        {"postgresql_partition_by": "RANGE (start_at)"},
+    )
 
+    # The partition key has to be a part of the primary key.
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         primary_key=True,
@@ -60,8 +84,46 @@ class ScheduledAppointment(Base):
         ForeignKey("doctors.id"),
         index=True,
     )
-    start_at: Mapped[datetime] = mapped_column()
+    start_at: Mapped[datetime] = mapped_column(primary_key=True)
     end_at: Mapped[datetime] = mapped_column()
+    during: Mapped[Range[datetime]] = mapped_column(
+        TSRANGE,
+        Computed("tsrange(start_at, end_at, '[)')", persisted=True),
+    )
+
+
+class DoctorDayOccupancy(Base):
+    """Busy time of a doctor merged from appointments starting on the day.
+
+    Derived from appointments and maintained in the same transactions.
+    """
+
+    __tablename__ = "doctor_day_occupancy"
+
+    doctor_id: Mapped[int] = mapped_column(
+        ForeignKey("doctors.id"),
+        primary_key=True,
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    busy: Mapped[list[Range[datetime]]] = mapped_column(
+        TSMULTIRANGE,
+        server_default=text("'{}'"),
+    )
+
+
+class DoctorScheduleVersion(Base):
+    """Counter bumped in every transaction changing a doctor's schedule.
+
+    Conditional reads of free intervals compare it instead of recomputing.
+    """
+
+    __tablename__ = "doctor_schedule_versions"
+
+    doctor_id: Mapped[int] = mapped_column(
+        ForeignKey("doctors.id"),
+        primary_key=True,
+    )
+    version: Mapped[int] = mapped_column(BigInteger, server_default=text("0"))
 
 
 class AppointmentRule(Base):
@@ -88,13 +150,16 @@ class AppointmentRule(Base):
 
     start_at: Mapped[time]
     duration: Mapped[timedelta]
+    # Occurrences starting before this moment are stored in appointments,
+    # later ones are generated from the rule on demand. Null for sole rules.
+    materialized_until: Mapped[datetime] = mapped_column(nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
         server_default=UTC_DATETIME_NOW,
     )
     updated_at: Mapped[datetime] = mapped_column(
         server_default=UTC_DATETIME_NOW,
-        onupdate=True,
+        onupdate=UTC_DATETIME_NOW,
     )
 
     def to_dataclass(self) -> AppointmentInDB:
@@ -110,4 +175,5 @@ class AppointmentRule(Base):
             start_at=self.start_at,
             duration=self.duration,
             created_at=self.created_at,
+            materialized_until=self.materialized_until,
         )
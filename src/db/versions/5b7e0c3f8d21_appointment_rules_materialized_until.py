@@ -0,0 +1,38 @@
+"""appointment rules materialized_until
+
+Revision ID: 5b7e0c3f8d21
+Revises: c41f2d9e7a10
+Create Date: 2024-10-04 09:12:47.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e0c3f8d21'
+down_revision: Union[str, None] = 'c41f2d9e7a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('appointment_rules', sa.Column('materialized_until', sa.DateTime(), nullable=True))
+    # Existing recurring rules are materialized up to their last occurrence.
+    op.execute(
+        """
+        UPDATE appointment_rules AS r
+        SET materialized_until = (
+            SELECT max(a.start_at) + INTERVAL '1 microsecond'
+            FROM appointments AS a
+            WHERE a.appointment_rule_id = r.id
+        )
+        WHERE r.schedule_type <> 'sole'
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('appointment_rules', 'materialized_until')
@@ -0,0 +1,150 @@
+"""partition_appointments
+
+Revision ID: 9d4e6b2a7c13
+Revises: f3c8d1a7b290
+Create Date: 2024-10-14 10:21:37.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e6b2a7c13'
+down_revision: Union[str, None] = 'f3c8d1a7b290'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('appointments_partitioned',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('appointment_rule_id', sa.UUID(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('start_at', sa.DateTime(), nullable=False),
+    sa.Column('end_at', sa.DateTime(), nullable=False),
+    sa.Column('during', postgresql.TSRANGE(), sa.Computed("tsrange(start_at, end_at, '[)')", persisted=True), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'start_at', name='appointments_partitioned_pkey'),
+    postgresql_partition_by='RANGE (start_at)'
+    )
+    # Partitioned tables cannot carry exclusion constraints, each monthly
+    # partition gets its own. Months holding stored appointments are created
+    # here, upcoming ones by the application on startup.
+    op.execute("""
+        DO $$
+        DECLARE
+            month date;
+            last_month date;
+            name text;
+        BEGIN
+            SELECT date_trunc('month', LEAST(min(start_at), now()::timestamp)),
+                   date_trunc('month', GREATEST(max(start_at), now()::timestamp))
+            INTO month, last_month
+            FROM appointments;
+            WHILE month <= last_month LOOP
+                name := 'appointments_p' || to_char(month, 'YYYYMM');
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF appointments_partitioned '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    name, month, month + interval '1 month'
+                );
+                EXECUTE format(
+                    'ALTER TABLE %I ADD CONSTRAINT %I '
+                    'EXCLUDE USING gist (doctor_id WITH =, during WITH &&)',
+                    name, name || '_doctor_id_during_excl'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END
+        $$
+    """)
+    op.execute(
+        "INSERT INTO appointments_partitioned "
+        "(id, appointment_rule_id, doctor_id, start_at, end_at) "
+        "SELECT id, appointment_rule_id, doctor_id, start_at, end_at "
+        "FROM appointments"
+    )
+    op.drop_table('appointments')
+    op.rename_table('appointments_partitioned', 'appointments')
+    op.execute(
+        "ALTER TABLE appointments RENAME CONSTRAINT "
+        "appointments_partitioned_pkey TO appointments_pkey"
+    )
+    op.create_foreign_key('appointments_appointment_rule_id_fkey', 'appointments', 'appointment_rules', ['appointment_rule_id'], ['id'])
+    op.create_foreign_key('appointments_doctor_id_fkey', 'appointments', 'doctors', ['doctor_id'], ['id'])
+    op.create_index(op.f('ix_appointments_doctor_id'), 'appointments', ['doctor_id'], unique=False)
+    op.create_index('ix_appointments_doctor_id_start_at_end_at', 'appointments', ['doctor_id', 'start_at', 'end_at'], unique=False)
+    # Exclusion constraints do not see rows of other partitions. Rows which
+    # may overlap ones of the neighbouring month (appointments last a day at
+    # most) take the booking lock of the doctor, so that such writers are
+    # serialized, and are checked against the other month.
+    op.execute("""
+        CREATE FUNCTION appointments_check_boundary_overlap() RETURNS trigger AS $$
+        DECLARE
+            month timestamp := date_trunc('month', NEW.start_at);
+        BEGIN
+            IF NEW.end_at > month + interval '1 month'
+               OR NEW.start_at < month + interval '1 day' THEN
+                PERFORM pg_advisory_xact_lock(1, NEW.doctor_id);
+                IF EXISTS (
+                    SELECT 1 FROM appointments
+                    WHERE doctor_id = NEW.doctor_id
+                      AND start_at > NEW.start_at - interval '1 day'
+                      AND start_at < NEW.end_at
+                      AND date_trunc('month', start_at) <> month
+                      AND during && tsrange(NEW.start_at, NEW.end_at, '[)')
+                ) THEN
+                    RAISE EXCEPTION 'appointment of doctor % overlaps another month',
+                        NEW.doctor_id
+                        USING ERRCODE = 'exclusion_violation';
+                END IF;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(
+        "CREATE TRIGGER appointments_boundary_overlap "
+        "BEFORE INSERT OR UPDATE ON appointments "
+        "FOR EACH ROW EXECUTE FUNCTION appointments_check_boundary_overlap()"
+    )
+
+
+def downgrade() -> None:
+    op.create_table('appointments_plain',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('appointment_rule_id', sa.UUID(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('start_at', sa.DateTime(), nullable=False),
+    sa.Column('end_at', sa.DateTime(), nullable=False),
+    sa.Column('during', postgresql.TSRANGE(), sa.Computed("tsrange(start_at, end_at, '[)')", persisted=True), nullable=True),
+    sa.PrimaryKeyConstraint('id', name='appointments_plain_pkey')
+    )
+    op.execute(
+        "INSERT INTO appointments_plain "
+        "(id, appointment_rule_id, doctor_id, start_at, end_at) "
+        "SELECT id, appointment_rule_id, doctor_id, start_at, end_at "
+        "FROM appointments"
+    )
+    # Dropping the partitioned table drops its partitions as well.
+    op.drop_table('appointments')
+    op.execute("DROP FUNCTION appointments_check_boundary_overlap()")
+    op.rename_table('appointments_plain', 'appointments')
+    op.execute(
+        "ALTER TABLE appointments RENAME CONSTRAINT "
+        "appointments_plain_pkey TO appointments_pkey"
+    )
+    op.create_foreign_key('appointments_appointment_rule_id_fkey', 'appointments', 'appointment_rules', ['appointment_rule_id'], ['id'])
+    op.create_foreign_key('appointments_doctor_id_fkey', 'appointments', 'doctors', ['doctor_id'], ['id'])
+    op.create_index(op.f('ix_appointments_doctor_id'), 'appointments', ['doctor_id'], unique=False)
+    op.create_index('ix_appointments_doctor_id_start_at_end_at', 'appointments', ['doctor_id', 'start_at', 'end_at'], unique=False)
+    op.create_exclude_constraint(
+        'appointments_doctor_id_during_excl',
+        'appointments',
+        ('doctor_id', '='),
+        ('during', '&&'),
+        using='gist',
+    )
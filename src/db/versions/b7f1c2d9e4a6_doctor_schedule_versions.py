@@ -0,0 +1,31 @@
+"""doctor_schedule_versions
+
+Revision ID: b7f1c2d9e4a6
+Revises: 9d4e6b2a7c13
+Create Date: 2024-10-16 15:08:42.930157
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f1c2d9e4a6'
+down_revision: Union[str, None] = '9d4e6b2a7c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('doctor_schedule_versions',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('doctor_schedule_versions')
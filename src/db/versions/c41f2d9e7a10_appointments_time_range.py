@@ -0,0 +1,81 @@
+"""appointments time range with exclusion constraint
+
+Revision ID: c41f2d9e7a10
+Revises: 8a21bebfaf86
+Create Date: 2024-10-02 11:20:14.512903
+
+The previous conflict check could let overlapping appointments of a doctor
+through, which the constraint rejects. The upgrade stops before changing
+anything and lists such appointments; resolve them, e.g. by deleting the
+rules booked later, and run it again.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f2d9e7a10'
+down_revision: Union[str, None] = '8a21bebfaf86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+OVERLAPS_REPORTED = 20
+
+
+def check_overlaps() -> None:
+    overlaps = op.get_bind().execute(sa.text("""
+        SELECT a.doctor_id,
+               a.appointment_rule_id, a.start_at, a.end_at,
+               b.appointment_rule_id, b.start_at, b.end_at,
+               count(*) OVER () AS total
+        FROM appointments a
+        JOIN appointments b
+          ON b.doctor_id = a.doctor_id
+         AND (b.start_at, b.id) > (a.start_at, a.id)
+         AND b.start_at < a.end_at
+         AND a.start_at < b.end_at
+        ORDER BY a.doctor_id, a.start_at
+        LIMIT :limit
+    """), {"limit": OVERLAPS_REPORTED}).all()
+    if not overlaps:
+        return
+    lines = [
+        f"doctor {row[0]}: rule {row[1]} at {row[2]}-{row[3]} "
+        f"overlaps rule {row[4]} at {row[5]}-{row[6]}"
+        for row in overlaps
+    ]
+    raise RuntimeError(
+        f"{overlaps[0].total} pairs of appointments overlap, resolve them "
+        "before adding the exclusion constraint:\n" + "\n".join(lines)
+    )
+
+
+def upgrade() -> None:
+    # Offline migrations have no data to check.
+    if not context.is_offline_mode():
+        check_overlaps()
+    # btree_gist provides GiST operator classes for plain columns such as
+    # doctor_id, which the exclusion constraint combines with the range.
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.add_column('appointments', sa.Column(
+        'during',
+        postgresql.TSRANGE(),
+        sa.Computed("tsrange(start_at, end_at, '[)')", persisted=True),
+        nullable=True,
+    ))
+    op.create_exclude_constraint(
+        'appointments_doctor_id_during_excl',
+        'appointments',
+        ('doctor_id', '='),
+        ('during', '&&'),
+        using='gist',
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('appointments_doctor_id_during_excl', 'appointments')
+    op.drop_column('appointments', 'during')
@@ -0,0 +1,26 @@
+"""appointments (doctor_id, start_at, end_at) index
+
+Revision ID: e2a94b6c1f58
+Revises: 5b7e0c3f8d21
+Create Date: 2024-10-08 15:03:26.740512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a94b6c1f58'
+down_revision: Union[str, None] = '5b7e0c3f8d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_appointments_doctor_id_start_at_end_at', 'appointments', ['doctor_id', 'start_at', 'end_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_appointments_doctor_id_start_at_end_at', table_name='appointments')
@@ -0,0 +1,33 @@
+"""doctor_day_occupancy
+
+Revision ID: f3c8d1a7b290
+Revises: e2a94b6c1f58
+Create Date: 2024-10-10 11:47:05.392816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8d1a7b290'
+down_revision: Union[str, None] = 'e2a94b6c1f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('doctor_day_occupancy',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('busy', postgresql.TSMULTIRANGE(), server_default=sa.text("'{}'"), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('doctor_day_occupancy')
@@ -16,3 +16,7 @@ class SelectedDateIsExceededError(Exception):
 
 class SelectedScheduleIsNotAvailableError(Exception):
     pass
+
+
+class BookingLockTimeoutError(Exception):
+    """Raised when bookings of a doctor stay locked by others for too long."""
@@ -1,20 +1,80 @@
+import contextlib
+import logging
+import time
+
 import uvicorn
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Request, status
 from fastapi.responses import Response
+from sqlalchemy.exc import DBAPIError
 
 from exceptions import (
+    BookingLockTimeoutError,
     DoctorSessionDurationExceededError,
     NotFoundError,
     SelectedDateIsExceededError,
     SelectedScheduleIsNotAvailableError,
 )
 from src.api.core import main_router
+from src.core import metrics
 from src.core.config import settings
+from src.core.db import sessionmanager
+from src.service.materializer import appointment_materializer
+from src.service.partitions import PartitionService
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await sessionmanager.warm_up(settings.POSTGRES_POOL_WARMUP)
+    try:
+        async with sessionmanager.session() as db:
+            await PartitionService(db=db).ensure_partitions()
+            await db.commit()
+    except DBAPIError:
+        # Migrations may run after the app starts, the materializer or the
+        # manage_partitions command creates the partitions later.
+        logger.exception("Creating appointment partitions failed")
+    if appointment_materializer is not None:
+        appointment_materializer.start()
+    yield
+    if appointment_materializer is not None:
+        await appointment_materializer.stop()
+    await sessionmanager.close()
 
-app = FastAPI(title=settings.APP_NAME)
+
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 app.include_router(main_router)
 
 
+@app.middleware("http")
+async def observe_request_duration(request: Request, call_next) -> Response:
+    started_at = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Route template keeps label cardinality bounded, unmatched paths are
+        # reported together.
+        route = request.scope.get("route")
+        metrics.http_request_duration.observe(
+            time.perf_counter() - started_at,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status_code,
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    return Response(
+        content=metrics.registry.render(),
+        media_type=metrics.CONTENT_TYPE,
+    )
+
+
 @app.exception_handler(NotFoundError)
 async def handle_not_found(*args, **kwargs) -> Response:
     return Response(status_code=status.HTTP_404_NOT_FOUND)
@@ -35,6 +95,14 @@ async def handle_dates_exception(*args, **kwargs) -> Response:
     return Response(status_code=status.HTTP_400_BAD_REQUEST)
 
 
+@app.exception_handler(BookingLockTimeoutError)
+async def handle_booking_lock_timeout(*args, **kwargs) -> Response:
+    return Response(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run(
         app=app,
@@ -1,60 +1,372 @@
+import dataclasses
 import datetime as dt
-from dataclasses import asdict
+import typing as t
+import uuid
+from uuid import UUID
 
-from sqlalchemy import and_, exists, func, insert, select
+from sqlalchemy import (
+    Integer,
+    and_,
+    bindparam,
+    column,
+    exists,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    TSMULTIRANGE,
+    TSRANGE,
+    Range,
+    insert,
+)
 
 from src.db.models import AppointmentRule, ScheduledAppointment
 from src.repo.base import RepoBase
-from src.schemas.appointment import AppointmentDate, AppointmentInDB
+from src.repo.occupancy import OccupancyRepo
+from src.schemas.appointment import (
+    MAX_APPOINTMENT_DURATION,
+    AppointmentConflict,
+    AppointmentDate,
+    AppointmentInDB,
+    CreateAppointment,
+    Interval,
+)
+from src.utils.dates import iterate_between_dates, to_aware_utc, to_naive_utc
+from src.utils.slots import get_day_bounds
+
+STREAM_BATCH_SIZE = 1000
 
 
 class AppointmentRepo(RepoBase):
 
     model = AppointmentRule
 
+    @staticmethod
+    def _to_row(rule: CreateAppointment) -> dict[str, t.Any]:
+        row = dataclasses.asdict(rule)
+        # timestamp columns hold naive UTC, aware values would be shifted by
+        # the session time zone of the server.
+        if row["materialized_until"] is not None:
+            row["materialized_until"] = to_naive_utc(row["materialized_until"])
+        return row
+
+    async def create(self, data: CreateAppointment) -> AppointmentInDB:
+        stmt = insert(self.model).values(**self._to_row(data)).returning(self.model)
+        query = await self._db.execute(stmt)
+        return query.scalar_one().to_dataclass()
+
+    async def create_many(
+        self,
+        rules: list[CreateAppointment],
+    ) -> list[AppointmentInDB]:
+        """Inserts rules with a single executemany, keeping their order."""
+        if not rules:
+            return []
+        result = await self._db.scalars(
+            insert(self.model).returning(self.model, sort_by_parameter_order=True),
+            [{**self._to_row(rule), "id": uuid.uuid4()} for rule in rules],
+        )
+        return [rule.to_dataclass() for rule in result]
+
+    async def list_lazy_rules(
+        self,
+        doctor_id: int,
+        until: dt.datetime,
+    ) -> list[AppointmentInDB]:
+        """Lists doctor rules having occurrences not materialized before until."""
+        stmt = select(self.model).where(
+            self.model.doctor_id == doctor_id,
+            self.model.materialized_until < to_naive_utc(until),
+        )
+        result = await self._db.scalars(stmt)
+        return [rule.to_dataclass() for rule in result]
+
+    async def list_doctors_to_materialize(
+        self,
+        until: dt.datetime,
+        limit: int,
+    ) -> list[int]:
+        """Lists doctors having rules not materialized before until.
+
+        Doctors whose rules lag the most go first.
+        """
+        stmt = (
+            select(self.model.doctor_id)
+            .where(self.model.materialized_until < to_naive_utc(until))
+            .group_by(self.model.doctor_id)
+            .order_by(func.min(self.model.materialized_until))
+            .limit(limit)
+        )
+        result = await self._db.scalars(stmt)
+        return list(result)
+
+    async def set_materialized_until(
+        self,
+        rule_id: UUID,
+        materialized_until: dt.datetime,
+    ) -> None:
+        stmt = (
+            update(self.model)
+            .where(self.model.id == rule_id)
+            .values(materialized_until=to_naive_utc(materialized_until))
+        )
+        await self._db.execute(stmt)
+
 
 class ScheduledAppointmentRepo(RepoBase):
 
     model = ScheduledAppointment
 
-    async def check_intersections_with_for_update(
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Kept in step with every write to appointments.
+        self.__occupancy_repo = OccupancyRepo(db=self._db)
+
+    @staticmethod
+    def _to_range(appointment: AppointmentDate) -> Range[dt.datetime]:
+        return Range(
+            to_naive_utc(appointment.start_at),
+            to_naive_utc(appointment.end_at),
+            bounds="[)",
+        )
+
+    def _start_at_between(
+        self,
+        appointments: t.Iterable[AppointmentDate],
+    ) -> t.Any:
+        """Constant bounds on start_at covering overlaps with appointments.
+
+        Predicates on range columns cannot prune partitions of the table,
+        these bounds let the planner skip months out of the batch.
+        """
+        since = min(appointment.start_at for appointment in appointments)
+        until = max(appointment.end_at for appointment in appointments)
+        return and_(
+            self.model.start_at > to_naive_utc(since) - MAX_APPOINTMENT_DURATION,
+            self.model.start_at < to_naive_utc(until),
+        )
+
+    async def check_intersections(
         self,
         doctor_id: int,
         appointments: list[AppointmentDate],
     ) -> bool:
-        conditions = [
-            and_(
-                self.model.start_at <= appointment.end_at,
-                self.model.end_at >= appointment.start_at,
-            )
-            for appointment in appointments
-        ]
+        """Checks whether any of appointments overlaps a scheduled one.
 
+        All occurrences are sent as a single multirange parameter, so the
+        statement is the same whatever the recurrence length and is served
+        by the GiST index of the exclusion constraint.
+        """
+        if not appointments:
+            return False
+        ranges = bindparam(
+            "ranges",
+            value=[self._to_range(appointment) for appointment in appointments],
+            type_=TSMULTIRANGE,
+        )
         stmt = select(
             exists().where(
-                and_(self.model.doctor_id == doctor_id, *conditions),
+                self.model.doctor_id == doctor_id,
+                self._start_at_between(appointments),
+                self.model.during.overlaps(ranges),
             )
-        ).with_for_update()
-
+        )
         query = await self._db.scalar(stmt)
         return bool(query)
 
+    async def find_intersecting(
+        self,
+        candidates: list[tuple[int, int, AppointmentDate]],
+    ) -> set[int]:
+        """Finds candidates overlapping scheduled appointments.
+
+        Candidates are ``(key, doctor_id, appointment)`` triples sent as
+        three parallel arrays, so a whole batch is checked by one statement
+        using the exclusion constraint index. Returns keys of the
+        candidates having an intersection.
+        """
+        if not candidates:
+            return set()
+        keys, doctor_ids, appointments = zip(*candidates)
+        rows = (
+            func.unnest(
+                bindparam("keys", value=list(keys), type_=ARRAY(Integer)),
+                bindparam("doctor_ids", value=list(doctor_ids), type_=ARRAY(Integer)),
+                bindparam(
+                    "ranges",
+                    value=[self._to_range(appointment) for appointment in appointments],
+                    type_=ARRAY(TSRANGE),
+                ),
+            )
+            .table_valued(
+                column("key", Integer),
+                column("doctor_id", Integer),
+                column("during", TSRANGE),
+            )
+            .render_derived(name="candidates")
+        )
+        stmt = (
+            select(rows.c.key)
+            .distinct()
+            .where(
+                exists().where(
+                    self.model.doctor_id == rows.c.doctor_id,
+                    self._start_at_between(appointments),
+                    self.model.during.overlaps(rows.c.during),
+                )
+            )
+        )
+        result = await self._db.scalars(stmt)
+        return set(result)
+
+    async def find_conflicts(
+        self,
+        doctor_id: int,
+        appointments: list[AppointmentDate],
+    ) -> dict[int, list[AppointmentConflict]]:
+        """Returns scheduled appointments overlapping each of appointments.
+
+        Conflicts are keyed by the position of the appointment in the list,
+        those without conflicts are omitted.
+        """
+        if not appointments:
+            return {}
+        rows = (
+            func.unnest(
+                bindparam(
+                    "ranges",
+                    value=[self._to_range(appointment) for appointment in appointments],
+                    type_=ARRAY(TSRANGE),
+                ),
+            )
+            .table_valued(column("during", TSRANGE), with_ordinality="position")
+            .render_derived(name="candidates")
+        )
+        stmt = (
+            select(
+                rows.c.position,
+                self.model.appointment_rule_id,
+                self.model.start_at,
+                self.model.end_at,
+            )
+            .join(
+                self.model,
+                and_(
+                    self.model.doctor_id == doctor_id,
+                    self._start_at_between(appointments),
+                    self.model.during.overlaps(rows.c.during),
+                ),
+            )
+            .order_by(rows.c.position, self.model.start_at)
+        )
+        result = await self._db.execute(stmt)
+        conflicts: dict[int, list[AppointmentConflict]] = {}
+        for row in result:
+            conflicts.setdefault(row.position - 1, []).append(
+                AppointmentConflict(
+                    appointment_rule_id=row.appointment_rule_id,
+                    start_at=to_aware_utc(row.start_at),
+                    end_at=to_aware_utc(row.end_at),
+                )
+            )
+        return conflicts
+
+    async def copy_many_appointments(
+        self,
+        appointments: t.Iterable[tuple[AppointmentInDB, AppointmentDate]],
+    ) -> None:
+        """Streams occurrences of many rules with COPY in one round trip."""
+        written: list[tuple[int, AppointmentDate]] = []
+        connection = await self._db.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        stmt = (
+            f"COPY {self.model.__tablename__} "
+            "(id, appointment_rule_id, doctor_id, start_at, end_at) FROM STDIN"
+        )
+        async with driver_connection.cursor() as cursor:
+            async with cursor.copy(stmt) as copy:
+                for rule, appointment in appointments:
+                    await copy.write_row(
+                        (
+                            uuid.uuid4(),
+                            rule.id,
+                            rule.doctor_id,
+                            to_naive_utc(appointment.start_at),
+                            to_naive_utc(appointment.end_at),
+                        )
+                    )
+                    written.append((rule.doctor_id, appointment))
+        await self.__occupancy_repo.add(written)
+
     async def create_many_appointments(
         self,
         appointment: AppointmentInDB,
         appointment_dates: list[AppointmentDate],
-    ):
-        await self._db.execute(
-            insert(self.model),
+        skip_conflicts: bool = False,
+    ) -> list[AppointmentDate]:
+        """Stores occurrences of the rule and returns the stored ones.
+
+        With skip_conflicts occurrences overlapping scheduled appointments
+        are left out instead of failing the whole statement.
+        """
+        if not appointment_dates:
+            return []
+        stmt = insert(self.model)
+        if skip_conflicts:
+            stmt = stmt.on_conflict_do_nothing().returning(
+                self.model.start_at,
+                self.model.end_at,
+            )
+        result = await self._db.execute(
+            stmt,
             [
                 {
-                    **asdict(dates),
+                    "start_at": to_naive_utc(dates.start_at),
+                    "end_at": to_naive_utc(dates.end_at),
                     "appointment_rule_id": appointment.id,
                     "doctor_id": appointment.doctor_id,
                 }
                 for dates in appointment_dates
             ],
         )
+        if skip_conflicts:
+            appointment_dates = [
+                AppointmentDate(
+                    start_at=to_aware_utc(row.start_at),
+                    end_at=to_aware_utc(row.end_at),
+                )
+                for row in result
+            ]
+        await self.__occupancy_repo.add(
+            (appointment.doctor_id, dates) for dates in appointment_dates
+        )
+        return appointment_dates
+
+    async def stream_appointments(
+        self,
+        doctor_id: int,
+        since: dt.datetime,
+        until: dt.datetime,
+    ) -> t.AsyncIterator[AppointmentDate]:
+        """Yields appointments overlapping [since, until) ordered by start."""
+        stmt = (
+            select(self.model.start_at, self.model.end_at)
+            .where(
+                self.model.doctor_id == doctor_id,
+                self._overlaps(to_naive_utc(since), to_naive_utc(until)),
+            )
+            .order_by(self.model.start_at)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        result = await self._db.stream(stmt)
+        async for row in result:
+            yield AppointmentDate(
+                start_at=to_aware_utc(row.start_at),
+                end_at=to_aware_utc(row.end_at),
+            )
 
     @staticmethod
     def __convert_to_datetime(datetime: str) -> dt.datetime:
@@ -71,38 +383,132 @@ class ScheduledAppointmentRepo(RepoBase):
             )
         return events
 
+    def _overlaps(
+        self,
+        since: t.Any,
+        until: t.Any,
+    ) -> t.Any:
+        """Range predicate served by the (doctor_id, start_at, end_at) index.
+
+        The lower bound on start_at relies on appointments lasting no longer
+        than MAX_APPOINTMENT_DURATION and keeps the index scan short.
+        """
+        return and_(
+            self.model.start_at > since - MAX_APPOINTMENT_DURATION,
+            self.model.start_at < until,
+            self.model.end_at > since,
+        )
+
     async def get_free_intervals(
         self,
         doctor_id: int,
         since: dt.date,
         until: dt.date,
-    ):
+    ) -> dict[dt.date, list[Interval]]:
+        """Returns appointments around the dates grouped by start date."""
+        since_at = dt.datetime.combine(since - dt.timedelta(days=1), dt.time.min)
+        until_at = dt.datetime.combine(until + dt.timedelta(days=2), dt.time.min)
         stmt = (
-            select(
-                func.date(self.model.start_at).label("event_date"),
-                self.model.start_at,
-                self.model.end_at,
-            )
+            select(self.model.start_at, self.model.end_at)
             .where(
                 self.model.doctor_id == doctor_id,
-                (self.model.start_at > since) | (self.model.end_at < until),
+                self._overlaps(since_at, until_at),
             )
             .order_by(self.model.start_at)
         )
 
         results = await self._db.execute(stmt)
 
-        grouped_events = {}
+        grouped_events: dict[dt.date, list[Interval]] = {}
         for row in results.mappings().all():
-            event_date = row.event_date
-            if event_date not in grouped_events:
-                grouped_events[event_date] = []
             start_at: dt.datetime = row.start_at
             end_at: dt.datetime = row.end_at
-            grouped_events[event_date].append(
+            grouped_events.setdefault(start_at.date(), []).append(
                 {
                     "start_at": start_at.replace(tzinfo=dt.timezone.utc),
                     "end_at": end_at.replace(tzinfo=dt.timezone.utc),
                 }
             )
         return grouped_events
+
+    async def get_free_slots(
+        self,
+        doctor_id: int,
+        since: dt.date,
+        until: dt.date,
+        available_start_at: dt.time,
+        available_end_at: dt.time,
+        step: dt.timedelta,
+        busy: t.Sequence[AppointmentDate] = (),
+    ) -> dict[dt.date, list[Interval]]:
+        """Computes free slots in the database.
+
+        Slot grids are produced by generate_series and anti-joined with
+        appointments, so only free slots are sent back. Intervals from busy
+        are excluded as well, they cover occurrences not stored in the table.
+        """
+        day_start_at, day_end_at = get_day_bounds(
+            date=since,
+            available_start_at=available_start_at,
+            available_end_at=available_end_at,
+        )
+        start_offset = day_start_at - dt.datetime.combine(
+            since,
+            dt.time.min,
+            tzinfo=dt.timezone.utc,
+        )
+        day_span = day_end_at - day_start_at
+        day = func.generate_series(
+            dt.datetime.combine(since, dt.time.min),
+            dt.datetime.combine(until, dt.time.min),
+            dt.timedelta(days=1),
+        ).column_valued("day")
+        # Functions in FROM are implicitly lateral, so slots refer to day.
+        slot_start_at = func.generate_series(
+            day + start_offset,
+            day + start_offset + day_span - dt.timedelta(microseconds=1),
+            step,
+        ).column_valued("slot_start_at")
+        slot_end_at = slot_start_at + step
+        stmt = (
+            select(
+                day.label("day"),
+                slot_start_at.label("start_at"),
+                slot_end_at.label("end_at"),
+            )
+            .where(
+                ~exists().where(
+                    self.model.doctor_id == doctor_id,
+                    # Constant bounds of the whole window prune partitions.
+                    self._overlaps(
+                        dt.datetime.combine(since - dt.timedelta(days=1), dt.time.min),
+                        dt.datetime.combine(until + dt.timedelta(days=2), dt.time.min),
+                    ),
+                    self._overlaps(slot_start_at, slot_end_at),
+                )
+            )
+            .order_by(slot_start_at)
+        )
+        if busy:
+            ranges = bindparam(
+                "busy",
+                value=[self._to_range(appointment) for appointment in busy],
+                type_=TSMULTIRANGE,
+            )
+            stmt = stmt.where(
+                ~func.tsrange(slot_start_at, slot_end_at).op("&&")(ranges),
+            )
+
+        results = await self._db.execute(stmt)
+
+        slots: dict[dt.date, list[Interval]] = {
+            date: [] for date in iterate_between_dates(since, until)
+        }
+        for row in results.mappings().all():
+            slots[row.day.date()].append(
+                {
+                    "start_at": to_aware_utc(row.start_at),
+                    "end_at": to_aware_utc(row.end_at),
+                }
+            )
+        return slots
@@ -1,16 +1,31 @@
+import inspect
 import typing as t
 from dataclasses import asdict, dataclass
 
 from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.db import Base
+from src.core.db import Base
+from src.core.metrics import timed_method
 
 
 class RepoBase:
 
     model: t.Type[Base]
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Public coroutine methods, inherited ones included, report timings.
+        for name in dir(cls):
+            method = getattr(cls, name)
+            if (
+                name.startswith("_")
+                or not inspect.iscoroutinefunction(method)
+                or getattr(method, "__timed__", False)
+            ):
+                continue
+            setattr(cls, name, timed_method(method, repo=cls.__name__))
+
     def __init__(self, db: AsyncSession):
         self._db: AsyncSession = db
 
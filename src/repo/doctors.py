@@ -1,8 +1,20 @@
-from sqlalchemy import select
+import typing as t
 
+from sqlalchemy import and_, or_, select
+
+from src.core.config import settings
 from src.db.models import Doctor
 from src.repo.base import RepoBase
-from src.schemas.doctors import DoctorInDB
+from src.schemas.doctors import DoctorFilter, DoctorInDB, DoctorListItem
+from src.utils.cache import TTLCache
+
+# Doctor profiles keyed by id. Rows change rarely, so reads are served from
+# here. Entries are only filled by reads, creating a doctor does not cache it
+# before the route commits.
+doctor_cache: TTLCache[int, DoctorInDB] = TTLCache(
+    maxsize=settings.DOCTOR_CACHE_SIZE,
+    ttl=settings.DOCTOR_CACHE_TTL,
+)
 
 
 class DoctorRepo(RepoBase):
@@ -10,13 +22,94 @@ class DoctorRepo(RepoBase):
     model = Doctor
 
     async def get_by_id(self, id: int) -> DoctorInDB | None:
+        doctor = doctor_cache.get(id)
+        if doctor is not None:
+            return doctor
         stmt = select(self.model).where(self.model.id == id)
         query = await self._db.execute(stmt)
         result = query.scalar_one_or_none()
         if result is None:
             return None
-        return result.to_dataclass()
+        doctor = result.to_dataclass()
+        doctor_cache.set(doctor.id, doctor)
+        return doctor
+
+    async def get_many_by_ids(self, ids: t.Iterable[int]) -> dict[int, DoctorInDB]:
+        doctors: dict[int, DoctorInDB] = {}
+        missing: set[int] = set()
+        for id in ids:
+            doctor = doctor_cache.get(id)
+            if doctor is None:
+                missing.add(id)
+            else:
+                doctors[id] = doctor
+        if missing:
+            stmt = select(self.model).where(self.model.id.in_(missing))
+            result = await self._db.scalars(stmt)
+            for row in result:
+                doctor = row.to_dataclass()
+                doctor_cache.set(doctor.id, doctor)
+                doctors[doctor.id] = doctor
+        return doctors
+
+    def _get_filter_conditions(self, filters: DoctorFilter) -> list[t.Any]:
+        conditions = []
+        if filters.min_session_duration is not None:
+            conditions.append(
+                self.model.max_session_duration >= filters.min_session_duration,
+            )
+        since, until = filters.available_from, filters.available_until
+        if since is None:
+            since = until
+        elif until is None:
+            until = since
+        if since is not None:
+            start_at = self.model.available_time_start
+            end_at = self.model.available_time_end
+            # Working hours ending not later than they start last past midnight.
+            overnight = end_at <= start_at
+            if since <= until:
+                conditions.append(
+                    or_(
+                        start_at == end_at,  # Round the clock.
+                        and_(~overnight, start_at <= since, end_at >= until),
+                        and_(overnight, or_(start_at <= since, end_at >= until)),
+                    )
+                )
+            else:
+                conditions.append(
+                    or_(
+                        start_at == end_at,  # Round the clock.
+                        and_(overnight, start_at <= since, end_at >= until),
+                    )
+                )
+        return conditions
+
+    async def list_doctors(
+        self,
+        after_id: int | None = None,
+        limit: int = 50,
+        filters: DoctorFilter | None = None,
+    ) -> list[DoctorListItem]:
+        """Lists a page of doctors ordered by id, starting after after_id.
 
-    async def list_doctors(self) -> list[DoctorInDB]:
-        result = await self._db.scalars(select(self.model))
-        return list(map(lambda d: d.to_dataclass(), result))
+        Filters are applied by the database and only listed columns are
+        selected, so a page costs the same regardless of the table size.
+        """
+        stmt = (
+            select(
+                self.model.id,
+                self.model.name,
+                self.model.summary,
+                self.model.max_session_duration,
+                self.model.created_at,
+            )
+            .order_by(self.model.id)
+            .limit(limit)
+        )
+        if after_id is not None:
+            stmt = stmt.where(self.model.id > after_id)
+        if filters is not None:
+            stmt = stmt.where(*self._get_filter_conditions(filters))
+        result = await self._db.execute(stmt)
+        return [DoctorListItem(**row) for row in result.mappings()]
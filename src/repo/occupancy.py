@@ -0,0 +1,135 @@
+import datetime as dt
+import typing as t
+
+from sqlalchemy import (
+    Date,
+    Integer,
+    bindparam,
+    cast,
+    column,
+    delete,
+    func,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSRANGE, Range, insert
+
+from src.db.models import DoctorDayOccupancy, ScheduledAppointment
+from src.repo.base import RepoBase
+from src.schemas.appointment import AppointmentDate, Interval
+from src.utils.dates import to_aware_utc, to_naive_utc
+
+
+class OccupancyRepo(RepoBase):
+    """Per-day busy time of doctors as merged multiranges.
+
+    An appointment belongs to the day it starts on, like in the grouping of
+    ScheduledAppointmentRepo.get_free_intervals, so reading a window of
+    days touches one row per day. The application never deletes
+    appointments, rows only grow and rebuild recomputes them from scratch.
+    """
+
+    model = DoctorDayOccupancy
+
+    @staticmethod
+    def _aggregate(appointments: t.Iterable[tuple[int, AppointmentDate]]):
+        """Merges ``(doctor_id, appointment)`` pairs per doctor and day."""
+        doctor_ids, ranges = [], []
+        for doctor_id, appointment in appointments:
+            doctor_ids.append(doctor_id)
+            ranges.append(
+                Range(
+                    to_naive_utc(appointment.start_at),
+                    to_naive_utc(appointment.end_at),
+                    bounds="[)",
+                )
+            )
+        rows = (
+            func.unnest(
+                bindparam("doctor_ids", value=doctor_ids, type_=ARRAY(Integer)),
+                bindparam("ranges", value=ranges, type_=ARRAY(TSRANGE)),
+            )
+            .table_valued(column("doctor_id", Integer), column("during", TSRANGE))
+            .render_derived(name="appointments")
+        )
+        day = cast(func.lower(rows.c.during), Date)
+        # Rows are locked in a stable order so that concurrent writers
+        # touching the same days wait for each other instead of deadlocking.
+        return (
+            select(
+                rows.c.doctor_id,
+                day.label("day"),
+                func.range_agg(rows.c.during).label("busy"),
+            )
+            .group_by(rows.c.doctor_id, day)
+            .order_by(rows.c.doctor_id, day)
+        )
+
+    async def add(self, appointments: t.Iterable[tuple[int, AppointmentDate]]):
+        appointments = list(appointments)
+        if not appointments:
+            return
+        stmt = insert(self.model).from_select(
+            ["doctor_id", "day", "busy"],
+            self._aggregate(appointments),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.doctor_id, self.model.day],
+            set_={"busy": self.model.busy + stmt.excluded.busy},
+        )
+        await self._db.execute(stmt)
+
+    async def rebuild(self, doctor_ids: t.Sequence[int]) -> None:
+        """Recomputes occupancy of the doctors from their appointments."""
+        appointment = ScheduledAppointment
+        day = cast(appointment.start_at, Date)
+        await self._db.execute(
+            delete(self.model).where(self.model.doctor_id.in_(doctor_ids))
+        )
+        await self._db.execute(
+            insert(self.model).from_select(
+                ["doctor_id", "day", "busy"],
+                select(
+                    appointment.doctor_id,
+                    day,
+                    func.range_agg(appointment.during),
+                )
+                .where(appointment.doctor_id.in_(doctor_ids))
+                .group_by(appointment.doctor_id, day),
+            )
+        )
+
+    async def get_busy(
+        self,
+        doctor_id: int,
+        since: dt.date,
+        until: dt.date,
+    ) -> dict[dt.date, list[Interval]]:
+        """Returns busy intervals around the dates grouped by start date.
+
+        Covers the same days as ScheduledAppointmentRepo.get_free_intervals,
+        adjacent appointments come back merged into one interval.
+        """
+        stmt = (
+            select(
+                self.model.day,
+                func.unnest(self.model.busy, type_=TSRANGE).label("during"),
+            )
+            .where(
+                self.model.doctor_id == doctor_id,
+                self.model.day.between(
+                    since - dt.timedelta(days=1),
+                    until + dt.timedelta(days=1),
+                ),
+            )
+            .order_by(self.model.day)
+        )
+        result = await self._db.execute(stmt)
+        busy: dict[dt.date, list[Interval]] = {}
+        for row in result:
+            busy.setdefault(row.day, []).append(
+                {
+                    "start_at": to_aware_utc(row.during.lower),
+                    "end_at": to_aware_utc(row.during.upper),
+                }
+            )
+        return busy
@@ -0,0 +1,76 @@
+import datetime as dt
+import re
+
+from sqlalchemy import text
+
+from src.db.models import ScheduledAppointment
+from src.repo.base import RepoBase
+
+PARTITION_NAME_FORMAT = "{table}_p{month:%Y%m}"
+# Partitioned tables cannot carry exclusion constraints, every partition
+# gets the one keeping appointments of a doctor from overlapping. Overlaps
+# across partitions are checked by a trigger of the parent table.
+EXCLUSION_CONSTRAINT = "EXCLUDE USING gist (doctor_id WITH =, during WITH &&)"
+
+
+class AppointmentPartitionRepo(RepoBase):
+    """Monthly partitions of appointments by start_at.
+
+    Months are passed as their first day, a partition holds appointments
+    starting within the month and is named like ``appointments_p202401``.
+    """
+
+    model = ScheduledAppointment
+
+    @property
+    def _table(self) -> str:
+        return self.model.__tablename__
+
+    def get_partition_name(self, month: dt.date) -> str:
+        return PARTITION_NAME_FORMAT.format(table=self._table, month=month)
+
+    async def list_partitions(self) -> list[dt.date]:
+        """Lists months of attached partitions in chronological order."""
+        result = await self._db.scalars(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+            ),
+            {"table": self._table},
+        )
+        pattern = re.compile(rf"{re.escape(self._table)}_p(\d{{4}})(\d{{2}})")
+        months = []
+        for name in result:
+            match = pattern.fullmatch(name)
+            if match is not None:
+                months.append(dt.date(int(match[1]), int(match[2]), 1))
+        return sorted(months)
+
+    async def create_partition(self, month: dt.date) -> None:
+        name = self.get_partition_name(month)
+        next_month = (month + dt.timedelta(days=31)).replace(day=1)
+        await self._db.execute(
+            text(
+                f'CREATE TABLE "{name}" PARTITION OF "{self._table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') "
+                f"TO ('{next_month.isoformat()}')"
+            )
+        )
+        await self._db.execute(
+            text(
+                f'ALTER TABLE "{name}" ADD CONSTRAINT '
+                f'"{name}_doctor_id_during_excl" {EXCLUSION_CONSTRAINT}'
+            )
+        )
+
+    async def detach_partition(self, month: dt.date) -> str:
+        """Detaches the partition, returns the name of the standalone table."""
+        name = self.get_partition_name(month)
+        await self._db.execute(
+            text(f'ALTER TABLE "{self._table}" DETACH PARTITION "{name}"')
+        )
+        return name
+
+    async def drop_table(self, name: str) -> None:
+        await self._db.execute(text(f'DROP TABLE "{name}"'))
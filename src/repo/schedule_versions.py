@@ -0,0 +1,34 @@
+import typing as t
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from src.db.models import DoctorScheduleVersion
+from src.repo.base import RepoBase
+
+
+class ScheduleVersionRepo(RepoBase):
+    """Per-doctor schedule versions, a doctor without a row is at 0."""
+
+    model = DoctorScheduleVersion
+
+    async def get_version(self, doctor_id: int) -> int:
+        version = await self._db.scalar(
+            select(self.model.version).where(self.model.doctor_id == doctor_id)
+        )
+        return version or 0
+
+    async def bump(self, doctor_ids: t.Iterable[int]) -> None:
+        # Rows are locked in a stable order, like occupancy ones, so that
+        # concurrent writers wait for each other instead of deadlocking.
+        doctor_ids = sorted(set(doctor_ids))
+        if not doctor_ids:
+            return
+        stmt = insert(self.model).values(
+            [{"doctor_id": doctor_id, "version": 1} for doctor_id in doctor_ids]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.doctor_id],
+            set_={"version": self.model.version + 1},
+        )
+        await self._db.execute(stmt)
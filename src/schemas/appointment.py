@@ -4,6 +4,9 @@ import enum
 import typing as t
 from uuid import UUID
 
+# Upper bound of a single appointment, lets range queries bound start_at.
+MAX_APPOINTMENT_DURATION = dt.timedelta(days=1)
+
 
 class WeekDay(enum.IntEnum):
     monday = 0
@@ -15,6 +18,17 @@ class WeekDay(enum.IntEnum):
     sunday = 6
 
 
+class SlotGranularity(enum.IntEnum):
+    """Supported slot durations in minutes."""
+
+    five = 5
+    ten = 10
+    fifteen = 15
+    twenty = 20
+    thirty = 30
+    sixty = 60
+
+
 class ScheduleType(str, enum.Enum):
     sole = "sole"
     weekday = "weekday"
@@ -33,9 +47,10 @@ class CreateAppointment:
     week_number: int | None
     start_at: dt.time
     duration: dt.timedelta
+    materialized_until: dt.datetime | None = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True, frozen=True)
 class AppointmentDate:
     start_at: dt.datetime
     end_at: dt.datetime
@@ -54,6 +69,42 @@ class AppointmentInDB:
     start_at: dt.time
     duration: dt.timedelta
     created_at: dt.datetime
+    materialized_until: dt.datetime | None = None
+
+
+class BulkItemStatus(str, enum.Enum):
+    created = "created"
+    doctor_not_found = "doctor_not_found"
+    date_exceeded = "date_exceeded"
+    not_available = "not_available"
+
+
+@dataclasses.dataclass
+class BulkAppointmentResult:
+    index: int
+    status: BulkItemStatus
+    appointment: AppointmentInDB | None = None
+
+
+@dataclasses.dataclass
+class DoctorSlot:
+    doctor_id: int
+    start_at: dt.datetime
+    end_at: dt.datetime
+
+
+@dataclasses.dataclass
+class AppointmentConflict:
+    appointment_rule_id: UUID
+    start_at: dt.datetime
+    end_at: dt.datetime
+
+
+@dataclasses.dataclass
+class QuotedAppointment:
+    start_at: dt.datetime
+    end_at: dt.datetime
+    conflicts: list[AppointmentConflict] = dataclasses.field(default_factory=list)
 
 
 class Interval(t.TypedDict):
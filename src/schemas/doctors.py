@@ -21,3 +21,19 @@ class CreateDoctor:
     max_session_duration: dt.timedelta | None
     available_time_start: dt.time
     available_time_end: dt.time
+
+
+@dataclass
+class DoctorListItem:
+    id: int
+    name: str
+    summary: str | None
+    max_session_duration: dt.timedelta | None
+    created_at: dt.datetime
+
+
+@dataclass
+class DoctorFilter:
+    available_from: dt.time | None = None
+    available_until: dt.time | None = None
+    min_session_duration: dt.timedelta | None = None
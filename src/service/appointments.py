@@ -1,7 +1,13 @@
-import calendar
+import bisect
+import collections
+import dataclasses
 import datetime as dt
+import heapq
+import logging
 import typing as t
-from collections import defaultdict
+
+from psycopg.errors import CheckViolation, ExclusionViolation
+from sqlalchemy.exc import IntegrityError
 
 from exceptions import (
     DoctorNotFoundError,
@@ -11,12 +17,57 @@ from exceptions import (
 )
 from schemas.appointment import CreateAppointment, Interval
 from service.base import ServiceBase
+from src.core import metrics
 from src.core.config import settings
 from src.repo.appointment import AppointmentRepo, ScheduledAppointmentRepo
 from src.repo.doctors import DoctorRepo
-from src.schemas.appointment import AppointmentDate, AppointmentInDB, ScheduleType
+from src.repo.occupancy import OccupancyRepo
+from src.repo.schedule_versions import ScheduleVersionRepo
+from src.schemas.appointment import (
+    MAX_APPOINTMENT_DURATION,
+    AppointmentConflict,
+    AppointmentDate,
+    AppointmentInDB,
+    BulkAppointmentResult,
+    BulkItemStatus,
+    DoctorSlot,
+    QuotedAppointment,
+    ScheduleType,
+)
 from src.schemas.doctors import DoctorInDB
-from utils.dates import iterate_between_dates
+from src.utils.cache import TTLCache
+from src.utils.recurrence import has_intersections, iter_occurrences_between
+from src.utils.slots import (
+    SLOT_DURATION,
+    DayBitmap,
+    get_day_bounds,
+    merge_intervals,
+    split_ranges_by_intervals,
+)
+from utils.dates import iterate_between_dates, to_aware_utc
+
+logger = logging.getLogger(__name__)
+
+EARLIEST_SLOTS_MAX_CHUNK_DAYS = 16
+
+# Computed free slots keyed by (doctor_id, date, granularity, min_duration,
+# version). Every booking bumps the schedule version of the doctor, so
+# entries computed before it, in any worker, are not read after it and
+# age out. The version is read in the session computing the slots, so a
+# lagging replica caches them under its own older version. Slots are kept
+# as tuples, reads copy them into fresh lists.
+free_intervals_cache: TTLCache[
+    tuple[int, dt.date, dt.timedelta, dt.timedelta | None, int],
+    tuple[Interval, ...],
+] = TTLCache(
+    maxsize=settings.FREE_INTERVALS_CACHE_SIZE,
+    ttl=settings.FREE_INTERVALS_CACHE_TTL,
+)
+# Quotes keyed by rule parameters, short-lived as bookings are not tracked.
+quote_cache: TTLCache[tuple, list[QuotedAppointment]] = TTLCache(
+    maxsize=settings.QUOTE_CACHE_SIZE,
+    ttl=settings.QUOTE_CACHE_TTL,
+)
 
 
 class AppointmentService(ServiceBase):
@@ -28,11 +79,28 @@ class AppointmentService(ServiceBase):
         self.__schedule_appointment_repo = ScheduledAppointmentRepo(
             db=self._db,
         )
+        self.__occupancy_repo = OccupancyRepo(db=self._db)
+        self.__schedule_version_repo = ScheduleVersionRepo(db=self._db)
 
         self.__schedule_for_days = settings.SCHEDULE_FOR_DAYS
         self.__schedule_until = (
             dt.datetime.utcnow() + dt.timedelta(days=self.__schedule_for_days)
         ).replace(tzinfo=dt.timezone.utc)
+        materialize_until = self.__schedule_until
+        if settings.APPOINTMENT_MATERIALIZE_DAYS is not None:
+            materialize_until = min(
+                self.__schedule_until,
+                (
+                    dt.datetime.utcnow()
+                    + dt.timedelta(days=settings.APPOINTMENT_MATERIALIZE_DAYS)
+                ).replace(tzinfo=dt.timezone.utc),
+            )
+        # Whole days keep the horizon still while rules are caught up to it.
+        self.__materialize_until = dt.datetime.combine(
+            materialize_until.date(),
+            dt.time.min,
+            tzinfo=dt.timezone.utc,
+        )
 
     async def __save_appointment(
         self,
@@ -40,10 +108,20 @@ class AppointmentService(ServiceBase):
         appointments: t.List[AppointmentDate],
     ) -> AppointmentInDB:
         created = await self.__appointment_repo.create(data=appointment)
-        await self.__schedule_appointment_repo.create_many_appointments(
-            appointment_dates=appointments,
-            appointment=created,
-        )
+        try:
+            await self.__schedule_appointment_repo.create_many_appointments(
+                appointment_dates=appointments,
+                appointment=created,
+            )
+        except IntegrityError as exc:
+            # A concurrent booking won the race after our conflict check.
+            if isinstance(exc.orig, ExclusionViolation):
+                raise SelectedScheduleIsNotAvailableError from exc
+            # Appointments has no check constraints, the month of an
+            # occurrence has no partition (detached or not created yet).
+            if isinstance(exc.orig, CheckViolation):
+                raise SelectedDateIsExceededError from exc
+            raise
         return created
 
     async def __is_schedule_free(
@@ -51,13 +129,18 @@ class AppointmentService(ServiceBase):
         doctor_id: int,
         appointments: t.List[AppointmentDate],
     ) -> bool:
-        is_found = (
-            await self.__schedule_appointment_repo.check_intersections_with_for_update(
-                doctor_id=doctor_id,
-                appointments=appointments,
-            )
+        is_found = await self.__schedule_appointment_repo.check_intersections(
+            doctor_id=doctor_id,
+            appointments=appointments,
         )
-        return not is_found
+        if is_found:
+            return False
+        lazy_appointments = await self.__get_lazy_appointments(
+            doctor_id=doctor_id,
+            since=appointments[0].start_at - dt.timedelta(days=1),
+            until=appointments[-1].end_at,
+        )
+        return not has_intersections(appointments, lazy_appointments)
 
     def __check_date_excess(
         self,
@@ -77,153 +160,66 @@ class AppointmentService(ServiceBase):
         if doctor.max_session_duration < data.duration:
             raise DoctorSessionDurationExceededError
 
-    async def __calculate_sole(
-        self,
-        data: CreateAppointment,
-    ) -> list[AppointmentDate]:
-        start_at = dt.datetime.combine(data.date, data.start_at)
-        end_at = start_at + data.duration
-        return [AppointmentDate(start_at=start_at, end_at=end_at)]
-
-    async def __calculate_weekday(
+    async def __calculate_next_appointments(
         self,
         data: CreateAppointment,
     ) -> list[AppointmentDate]:
-        appointments: list[AppointmentDate] = []
-        start_at = dt.datetime.combine(data.date, data.start_at)
-        end_at = start_at + data.duration
-        while self.__check_date_excess(end_at) is False:
-            appointments.append(
-                AppointmentDate(
-                    start_at=start_at,
-                    end_at=end_at,
-                )
+        date_as_datetime = dt.datetime.combine(
+            date=data.date,
+            time=dt.datetime.min.time(),
+            tzinfo=dt.timezone.utc,
+        )
+        self.__check_date_excess(date_as_datetime, raise_exception=True)
+        appointments = list(
+            iter_occurrences_between(
+                data,
+                since=date_as_datetime,
+                until=self.__schedule_until,
             )
-            start_at = start_at + dt.timedelta(weeks=1)
-            end_at = start_at + data.duration
+        )
+        if not appointments:
+            raise SelectedDateIsExceededError
         return appointments
 
-    async def __calculate_monthly(
+    async def __iter_lazy_appointments(
         self,
-        data: CreateAppointment,
-    ) -> list[AppointmentDate]:
-        nearest = data.date
-        _, nearset_month_days = calendar.monthrange(
-            year=nearest.year,
-            month=nearest.month,
-        )
-        if nearest.day > data.day_of_month:
-            nearest = nearest.replace(
-                month=nearest.month + 1,
-                day=data.day_of_month,
-            )
-        elif nearest.day < data.day_of_month:
-            if nearset_month_days < data.day_of_month:
-                day = nearset_month_days
-            else:
-                day = data.day_of_month
-            nearest = nearest.replace(
-                day=day,
-            )
+        doctor_id: int,
+        since: dt.datetime,
+        until: dt.datetime,
+    ) -> t.Iterator[AppointmentDate]:
+        """Generates occurrences of rules which are not materialized yet.
 
-        start_at = dt.datetime.combine(nearest, data.start_at)
-        last: AppointmentDate = AppointmentDate(
-            start_at=start_at,
-            end_at=start_at + data.duration,
+        Occurrences of all rules are merged lazily in chronological order.
+        """
+        rules = await self.__appointment_repo.list_lazy_rules(
+            doctor_id=doctor_id,
+            until=until,
         )
-        self.__check_date_excess(last.end_at, raise_exception=True)
-        appointments: list[AppointmentDate] = [
-            last,
-        ]
-
-        while self.__check_date_excess(last.end_at) is False:
-            last_year = last.start_at.year
-            last_month = last.start_at.month
-            day = data.day_of_month
-            year = last_year + 1 if last_month == 12 else last_year
-            month = 1 if last_month == 12 else last_month + 1
-
-            _, month_days = calendar.monthrange(
-                year=year,
-                month=month,
-            )
-            if day > month_days:
-                day = month_days  # Set last day of month.
-            delta_appointment = last.start_at.replace(
-                year=year,
-                month=month,
-                day=day,
-            )
-            appointment = AppointmentDate(
-                start_at=delta_appointment,
-                end_at=delta_appointment + data.duration,
-            )
-            appointments.append(appointment)
-            last = appointment
-        return appointments
-
-    async def __calculate_monthly_weekday(
-        self,
-        data: CreateAppointment,
-    ) -> list[AppointmentDate]:
-        start_date = dt.datetime.combine(data.date, data.start_at)
-        delta_date = start_date
-        appointments: list[AppointmentDate] = []
-        while self.__check_date_excess(delta_date) is False:
-            _, month_days = calendar.monthrange(
-                year=delta_date.year,
-                month=delta_date.month,
-            )
-            occurrences = 0
-            for day in range(1, month_days):
-                delta_date = delta_date.replace(day=day)
-
-                weekday = calendar.weekday(
-                    year=delta_date.year,
-                    month=delta_date.month,
-                    day=delta_date.day,
+        return heapq.merge(
+            *(
+                iter_occurrences_between(
+                    rule,
+                    since=max(since, to_aware_utc(rule.materialized_until)),
+                    until=until,
                 )
-                if weekday == data.day_of_week:
-                    occurrences += 1
-                if occurrences == data.week_number:
-                    if delta_date.date() < data.date:
-                        continue
-                    appointment = AppointmentDate(
-                        start_at=delta_date,
-                        end_at=delta_date + data.duration,
-                    )
-                    appointments.append(appointment)
-                    break
-            month = 1 if delta_date.month == 12 else delta_date.month + 1
-            year = delta_date.year + 1 if delta_date.month == 12 else delta_date.year
-            delta_date = delta_date.replace(
-                year=year,
-                month=month,
-                day=1,
-            )
-        return appointments
+                for rule in rules
+            ),
+            key=lambda x: x.start_at,
+        )
 
-    async def __calculate_next_appointments(
+    async def __get_lazy_appointments(
         self,
-        data: CreateAppointment,
+        doctor_id: int,
+        since: dt.datetime,
+        until: dt.datetime,
     ) -> list[AppointmentDate]:
-        date_as_datetime = dt.datetime.combine(
-            date=data.date,
-            time=dt.datetime.min.time(),
-            tzinfo=dt.timezone.utc,
+        return list(
+            await self.__iter_lazy_appointments(
+                doctor_id=doctor_id,
+                since=since,
+                until=until,
+            )
         )
-        self.__check_date_excess(date_as_datetime, raise_exception=True)
-        match data.schedule_type:
-            case ScheduleType.sole:
-                return await self.__calculate_sole(data)
-            case ScheduleType.weekday:
-                return await self.__calculate_weekday(data)
-            case ScheduleType.monthly:
-                return await self.__calculate_monthly(data)
-            case ScheduleType.monthly_weekday:
-                return await self.__calculate_monthly_weekday(data)
-            case _ as unreachable:
-                t.assert_never(unreachable)
 
     async def create_appointment(
         self,
@@ -239,96 +235,601 @@ class AppointmentService(ServiceBase):
         )
         if can_schedule is False:
             raise SelectedScheduleIsNotAvailableError
-        return await self.__save_appointment(data, dates)
+        data, materialized = self.__split_materialized(data, dates)
+        created = await self.__save_appointment(data, materialized)
+        await self.__schedule_version_repo.bump([data.doctor_id])
+        return created
 
-    @staticmethod
-    def __calculate_slots(
-        date: dt.date,
-        available_start_at: dt.time,
-        available_end_at: dt.time,
-        scheduled: list[dict],
-    ) -> list[Interval]:
-        scheduled: list[Interval] = sorted(
-            scheduled,
-            key=lambda x: x["start_at"],
-        )
-        slots = []
-        delta = dt.datetime.combine(
-            date=date,
-            time=available_start_at,
-            tzinfo=dt.timezone.utc,
+    async def quote_appointment(
+        self,
+        data: CreateAppointment,
+    ) -> list[QuotedAppointment]:
+        """Lists occurrences of the rule with their conflicts, writes nothing.
+
+        Results are memoized by rule parameters for QUOTE_CACHE_TTL seconds.
+        """
+        key = dataclasses.astuple(data)
+        quote = quote_cache.get(key)
+        if quote is not None:
+            return quote
+        doctor = await self.__doctor_repo.get_by_id(data.doctor_id)
+        if doctor is None:
+            raise DoctorNotFoundError
+        dates = await self.__calculate_next_appointments(data)
+        conflicts = await self.__schedule_appointment_repo.find_conflicts(
+            doctor_id=data.doctor_id,
+            appointments=dates,
         )
-        if available_end_at <= available_start_at:
-            # In case of next day in UTC timezone.
-            end_at = (delta + dt.timedelta(days=1)).replace(
-                hour=available_end_at.hour,
-                minute=available_end_at.minute,
-                second=available_end_at.second,
+        quote = [
+            QuotedAppointment(
+                start_at=appointment.start_at,
+                end_at=appointment.end_at,
+                conflicts=conflicts.get(position, []),
             )
-        else:
-            end_at = delta.replace(
-                hour=available_end_at.hour,
-                minute=available_end_at.minute,
-                second=available_end_at.second,
+            for position, appointment in enumerate(dates)
+        ]
+        await self.__add_lazy_conflicts(data.doctor_id, quote)
+        quote_cache.set(key, quote)
+        return quote
+
+    async def __add_lazy_conflicts(
+        self,
+        doctor_id: int,
+        quote: list[QuotedAppointment],
+    ) -> None:
+        """Adds conflicts with occurrences which are not materialized yet."""
+        rules = await self.__appointment_repo.list_lazy_rules(
+            doctor_id=doctor_id,
+            until=quote[-1].end_at,
+        )
+        if not rules:
+            return
+        starts = [item.start_at for item in quote]
+        for rule in rules:
+            occurrences = iter_occurrences_between(
+                rule,
+                since=max(
+                    quote[0].start_at - MAX_APPOINTMENT_DURATION,
+                    to_aware_utc(rule.materialized_until),
+                ),
+                until=quote[-1].end_at,
             )
+            for occurrence in occurrences:
+                # Quoted occurrences are sorted and disjoint, overlapping
+                # ones precede the first starting after the occurrence.
+                position = bisect.bisect_left(starts, occurrence.end_at)
+                while position and quote[position - 1].end_at > occurrence.start_at:
+                    position -= 1
+                    quote[position].conflicts.append(
+                        AppointmentConflict(
+                            appointment_rule_id=rule.id,
+                            start_at=occurrence.start_at,
+                            end_at=occurrence.end_at,
+                        )
+                    )
+        for item in quote:
+            item.conflicts.sort(key=lambda conflict: conflict.start_at)
 
-        while delta < end_at:
-            delta_start: dt.datetime = delta
-            delta_end = delta = delta_start + dt.timedelta(minutes=15)
-            delta_scheduled = None
-            if scheduled:
-                delta_scheduled = scheduled[0]
-            if delta_scheduled is not None:
-                start_at = delta_scheduled["start_at"]
-                end_at = delta_scheduled["end_at"]
-                if (
-                    (end_at > delta_end > start_at)
-                    or (delta_end == end_at == start_at)
-                    or (start_at < delta_start < end_at)
-                ):
-                    continue
-
-                if delta_start >= end_at:
-                    scheduled.pop(0)
-            interval: Interval = {"start_at": delta_start, "end_at": delta_end}
-            slots.append(interval)
-        return slots
-
-    async def __split_ranges_by_intervals(
+    def __split_materialized(
         self,
+        data: CreateAppointment,
+        appointments: list[AppointmentDate],
+    ) -> tuple[CreateAppointment, list[AppointmentDate]]:
+        """Returns rule data and occurrences which have to be stored."""
+        if data.schedule_type == ScheduleType.sole:
+            return data, appointments
+        # Only the near term is stored, the rest is generated lazily.
+        data = dataclasses.replace(
+            data,
+            materialized_until=self.__materialize_until,
+        )
+        return data, [
+            appointment
+            for appointment in appointments
+            if appointment.start_at < self.__materialize_until
+        ]
+
+    async def create_appointments_bulk(
+        self,
+        items: list[CreateAppointment],
+    ) -> list[BulkAppointmentResult]:
+        """Creates many rules at once with a result for every item.
+
+        Items are checked against the schedule with a single query and
+        against each other in order of appearance, so an item overlapping
+        an earlier accepted one is rejected. Accepted rules are inserted
+        with one statement and their occurrences with one COPY, if that
+        fails on a conflict they are inserted one by one under savepoints.
+        """
+        doctors = await self.__doctor_repo.get_many_by_ids(
+            item.doctor_id for item in items
+        )
+        results = [
+            BulkAppointmentResult(index=index, status=BulkItemStatus.created)
+            for index in range(len(items))
+        ]
+        planned: dict[int, list[AppointmentDate]] = {}
+        for index, item in enumerate(items):
+            if item.doctor_id not in doctors:
+                results[index].status = BulkItemStatus.doctor_not_found
+                continue
+            try:
+                planned[index] = await self.__calculate_next_appointments(item)
+            except SelectedDateIsExceededError:
+                results[index].status = BulkItemStatus.date_exceeded
+
+        intersecting = await self.__schedule_appointment_repo.find_intersecting(
+            [
+                (index, items[index].doctor_id, appointment)
+                for index, appointments in planned.items()
+                for appointment in appointments
+            ]
+        )
+        occupied: dict[int, list[AppointmentDate]] = {}
+        accepted: list[int] = []
+        for index, appointments in planned.items():
+            doctor_id = items[index].doctor_id
+            if doctor_id not in occupied:
+                occupied[doctor_id] = await self.__get_lazy_appointments(
+                    doctor_id=doctor_id,
+                    since=dt.datetime.now(tz=dt.timezone.utc) - dt.timedelta(days=1),
+                    until=self.__schedule_until,
+                )
+            if index in intersecting or has_intersections(
+                appointments,
+                occupied[doctor_id],
+            ):
+                results[index].status = BulkItemStatus.not_available
+                continue
+            for appointment in appointments:
+                bisect.insort(
+                    occupied[doctor_id], appointment, key=lambda x: x.start_at
+                )
+            accepted.append(index)
+
+        prepared = {
+            index: self.__split_materialized(items[index], planned[index])
+            for index in accepted
+        }
+        try:
+            async with self._db.begin_nested():
+                created = dict(
+                    zip(prepared, await self.__store_rules(list(prepared.values())))
+                )
+        except (ExclusionViolation, CheckViolation):
+            # A concurrent booking won the race after our conflict check, or
+            # an occurrence falls into a month without a partition. Items are
+            # stored one by one to report which of them failed.
+            created = {}
+            for index, item in prepared.items():
+                try:
+                    async with self._db.begin_nested():
+                        created[index] = (await self.__store_rules([item]))[0]
+                except ExclusionViolation:
+                    results[index].status = BulkItemStatus.not_available
+                except CheckViolation:
+                    results[index].status = BulkItemStatus.date_exceeded
+        await self.__schedule_version_repo.bump(
+            rule.doctor_id for rule in created.values()
+        )
+        for index, rule in created.items():
+            results[index].appointment = rule
+        return results
+
+    async def __store_rules(
+        self,
+        prepared: list[tuple[CreateAppointment, list[AppointmentDate]]],
+    ) -> list[AppointmentInDB]:
+        """Inserts rules with one statement and their occurrences with COPY."""
+        created = await self.__appointment_repo.create_many(
+            [data for data, _ in prepared],
+        )
+        await self.__schedule_appointment_repo.copy_many_appointments(
+            (rule, appointment)
+            for rule, (_, appointments) in zip(created, prepared)
+            for appointment in appointments
+        )
+        return created
+
+    async def list_doctors_to_materialize(self, limit: int = 100) -> list[int]:
+        """Lists doctors whose rules lag behind the materialization horizon."""
+        return await self.__appointment_repo.list_doctors_to_materialize(
+            until=self.__materialize_until,
+            limit=limit,
+        )
+
+    async def materialize_appointments(
+        self,
+        doctor_id: int,
+        chunk: dt.timedelta | None = None,
+    ) -> int:
+        """Stores occurrences of the doctor rules up to the horizon.
+
+        The caller holds the booking lock of the doctor until it commits.
+        Rules are read under the lock, so a concurrent run which extended
+        them already is not repeated. Each rule is extended by chunk at
+        most, occurrences overlapping scheduled appointments are skipped,
+        and the new materialized_until is written in the same transaction
+        as the occurrences, so an interrupted run resumes where it stopped.
+        Returns a number of processed rules.
+        """
+        rules = await self.__appointment_repo.list_lazy_rules(
+            doctor_id=doctor_id,
+            until=self.__materialize_until,
+        )
+        for rule in rules:
+            await self.__materialize_rule(rule, chunk)
+        return len(rules)
+
+    async def __materialize_rule(
+        self,
+        rule: AppointmentInDB,
+        chunk: dt.timedelta | None,
+    ) -> None:
+        # Past occurrences are not stored, their months may be detached.
+        since = max(
+            to_aware_utc(rule.materialized_until),
+            dt.datetime.combine(
+                dt.datetime.now(tz=dt.timezone.utc).date(),
+                dt.time.min,
+                tzinfo=dt.timezone.utc,
+            ),
+        )
+        until = self.__materialize_until
+        if chunk is not None:
+            until = min(until, since + chunk)
+        dates = list(iter_occurrences_between(rule, since=since, until=until))
+        # Overlaps with another month are raised by the table trigger rather
+        # than skipped on conflict, so they are filtered out beforehand.
+        intersecting = await self.__schedule_appointment_repo.find_intersecting(
+            [(index, rule.doctor_id, date) for index, date in enumerate(dates)]
+        )
+        stored = await self.__schedule_appointment_repo.create_many_appointments(
+            appointment=rule,
+            appointment_dates=[
+                date for index, date in enumerate(dates) if index not in intersecting
+            ],
+            skip_conflicts=True,
+        )
+        metrics.materialized_appointments.inc(len(stored), result="stored")
+        metrics.materialized_appointments.inc(
+            len(dates) - len(stored), result="conflict"
+        )
+        if len(stored) != len(dates):
+            skipped = set(dates).difference(stored)
+            for date in sorted(skipped, key=lambda x: x.start_at):
+                logger.warning(
+                    "Skipped occurrence of rule %s at %s overlapping "
+                    "a scheduled appointment",
+                    rule.id,
+                    date.start_at.isoformat(),
+                )
+            # Skipped occurrences were served as busy lazy ones until now.
+            await self.__schedule_version_repo.bump([rule.doctor_id])
+        await self.__appointment_repo.set_materialized_until(
+            rule_id=rule.id,
+            materialized_until=until,
+        )
+
+    async def __compute_free_intervals(
+        self,
+        doctor: DoctorInDB,
         since: dt.date,
         until: dt.date,
-        doctor: DoctorInDB,
-        appointments,
-    ):
-        appointments = defaultdict(list, appointments)
-        intervals: dict[dt.date, list[Interval]] = {}
-        for date in iterate_between_dates(since, until):
-            intervals[date] = self.__calculate_slots(
-                date=date,
+        step: dt.timedelta,
+    ) -> dict[dt.date, list[Interval]]:
+        lazy_appointments = await self.__get_lazy_appointments(
+            doctor_id=doctor.id,
+            since=dt.datetime.combine(
+                since - dt.timedelta(days=1),
+                dt.time.min,
+                tzinfo=dt.timezone.utc,
+            ),
+            until=dt.datetime.combine(
+                until + dt.timedelta(days=2),
+                dt.time.min,
+                tzinfo=dt.timezone.utc,
+            ),
+        )
+        if settings.FREE_INTERVALS_BACKEND == "sql":
+            return await self.__schedule_appointment_repo.get_free_slots(
+                doctor_id=doctor.id,
+                since=since,
+                until=until,
                 available_start_at=doctor.available_time_start,
                 available_end_at=doctor.available_time_end,
-                scheduled=appointments[date],
+                step=step,
+                busy=lazy_appointments,
             )
-        return intervals
+
+        if settings.FREE_INTERVALS_BACKEND == "occupancy":
+            data = await self.__occupancy_repo.get_busy(
+                doctor_id=doctor.id,
+                since=since,
+                until=until,
+            )
+        else:
+            data = await self.__schedule_appointment_repo.get_free_intervals(
+                doctor_id=doctor.id,
+                until=until,
+                since=since,
+            )
+        for appointment in lazy_appointments:
+            data.setdefault(appointment.start_at.date(), []).append(
+                {"start_at": appointment.start_at, "end_at": appointment.end_at}
+            )
+        return split_ranges_by_intervals(
+            since=since,
+            until=until,
+            available_start_at=doctor.available_time_start,
+            available_end_at=doctor.available_time_end,
+            appointments=data,
+            step=step,
+        )
+
+    async def get_schedule_version(self, doctor_id: int) -> int:
+        """Returns the version bumped by every change of the doctor schedule.
+
+        Free intervals read after the version are at least as recent.
+        """
+        return await self.__schedule_version_repo.get_version(doctor_id)
 
     async def get_free_intervals(
         self,
         doctor_id: int,
         since: dt.date,
         until: dt.date,
+        granularity: dt.timedelta = SLOT_DURATION,
+        min_duration: dt.timedelta | None = None,
+        version: int | None = None,
     ):
+        """Returns free slots of granularity by day.
+
+        With min_duration contiguous slots are merged and only runs lasting
+        at least min_duration are returned. Cached slots are only used when
+        computed at version, which is looked up unless given.
+        """
         until = min(until, self.__schedule_until.date())
         since = max(since, dt.datetime.now(tz=dt.timezone.utc).date())
+        if version is None:
+            version = await self.get_schedule_version(doctor_id)
+        variant = (granularity, min_duration, version)
+        intervals: dict[dt.date, list[Interval]] = {}
+        missing: list[dt.date] = []
+        for date in iterate_between_dates(since, until):
+            cached = free_intervals_cache.get((doctor_id, date, *variant))
+            if cached is None:
+                missing.append(date)
+                intervals[date] = None
+            else:
+                intervals[date] = list(cached)
+        if not missing:
+            return intervals
+
         doctor = await self.__doctor_repo.get_by_id(doctor_id)
         if doctor is None:
             raise DoctorNotFoundError
-        data = await self.__schedule_appointment_repo.get_free_intervals(
+        computed = await self.__compute_free_intervals(
+            doctor=doctor,
+            since=missing[0],
+            until=missing[-1],
+            step=granularity,
+        )
+        for date in missing:
+            slots = computed[date]
+            if min_duration is not None:
+                _, end_at = get_day_bounds(
+                    date=date,
+                    available_start_at=doctor.available_time_start,
+                    available_end_at=doctor.available_time_end,
+                )
+                slots = merge_intervals(slots, min_duration, end_at)
+            intervals[date] = slots
+            free_intervals_cache.set((doctor_id, date, *variant), tuple(slots))
+        return intervals
+
+    @staticmethod
+    async def __merge_appointments(
+        stored: t.AsyncIterator[AppointmentDate],
+        generated: t.Iterator[AppointmentDate],
+    ) -> t.AsyncIterator[AppointmentDate]:
+        """Merges two chronologically ordered streams of appointments."""
+        first = await anext(stored, None)
+        second = next(generated, None)
+        while first is not None or second is not None:
+            if second is None or (
+                first is not None and first.start_at <= second.start_at
+            ):
+                yield first
+                first = await anext(stored, None)
+            else:
+                yield second
+                second = next(generated, None)
+
+    async def iter_free_intervals(
+        self,
+        doctor_id: int,
+        since: dt.date,
+        until: dt.date,
+        granularity: dt.timedelta = SLOT_DURATION,
+        min_duration: dt.timedelta | None = None,
+    ) -> t.AsyncIterator[tuple[dt.date, list[Interval]]]:
+        """Yields free intervals day by day for arbitrary long ranges.
+
+        Appointments are read as an ordered stream and only those which
+        may still affect upcoming days are kept, so memory does not grow
+        with the range.
+        """
+        until = min(until, self.__schedule_until.date())
+        since = max(since, dt.datetime.now(tz=dt.timezone.utc).date())
+        doctor = await self.__doctor_repo.get_by_id(doctor_id)
+        if doctor is None:
+            raise DoctorNotFoundError
+        if since > until:
+            return
+        since_at, _ = get_day_bounds(
+            date=since,
+            available_start_at=doctor.available_time_start,
+            available_end_at=doctor.available_time_end,
+        )
+        _, until_at = get_day_bounds(
+            date=until,
+            available_start_at=doctor.available_time_start,
+            available_end_at=doctor.available_time_end,
+        )
+        generated = await self.__iter_lazy_appointments(
             doctor_id=doctor_id,
-            until=until,
-            since=since,
+            since=since_at - dt.timedelta(days=1),
+            until=until_at,
         )
-        intervals = await self.__split_ranges_by_intervals(
-            doctor=doctor, appointments=data, since=since, until=until
+        appointments = self.__merge_appointments(
+            self.__schedule_appointment_repo.stream_appointments(
+                doctor_id=doctor_id,
+                since=since_at,
+                until=until_at,
+            ),
+            generated,
         )
-        return intervals
+        try:
+            pending: list[AppointmentDate] = []
+            upcoming = await anext(appointments, None)
+            for date in iterate_between_dates(since, until):
+                bitmap = DayBitmap.for_day(
+                    date=date,
+                    available_start_at=doctor.available_time_start,
+                    available_end_at=doctor.available_time_end,
+                    step=granularity,
+                )
+                day_end_at = bitmap.start_at + bitmap.step * bitmap.width
+                while upcoming is not None and upcoming.start_at < day_end_at:
+                    pending.append(upcoming)
+                    upcoming = await anext(appointments, None)
+                pending = [x for x in pending if x.end_at > bitmap.start_at]
+                for appointment in pending:
+                    bitmap.mark_busy(appointment.start_at, appointment.end_at)
+                slots = list(bitmap.iter_free())
+                if min_duration is not None:
+                    _, end_at = get_day_bounds(
+                        date=date,
+                        available_start_at=doctor.available_time_start,
+                        available_end_at=doctor.available_time_end,
+                    )
+                    slots = merge_intervals(slots, min_duration, end_at)
+                yield date, slots
+        finally:
+            await appointments.aclose()
+
+    @staticmethod
+    async def __iter_fitting_intervals(
+        slots: t.AsyncIterator[Interval],
+        duration: dt.timedelta,
+        since: dt.datetime,
+    ) -> t.AsyncIterator[Interval]:
+        """Yields slot-aligned intervals of duration inside free runs.
+
+        Runs continue across days, an interval is yielded as soon as the
+        run starting with its slot lasts for duration.
+        """
+        starts: collections.deque[dt.datetime] = collections.deque()
+        run_end_at = None
+        async for slot in slots:
+            if slot["start_at"] != run_end_at:
+                starts.clear()
+            starts.append(slot["start_at"])
+            run_end_at = slot["end_at"]
+            while starts and starts[0] + duration <= run_end_at:
+                start_at = starts.popleft()
+                if start_at >= since:
+                    yield {"start_at": start_at, "end_at": start_at + duration}
+
+    async def __iter_doctor_slots(
+        self,
+        doctor_id: int,
+        since: dt.date,
+        until: dt.date,
+        duration: dt.timedelta,
+    ) -> t.AsyncIterator[Interval]:
+        """Lazily yields free intervals of a doctor in chronological order.
+
+        Days are loaded in growing chunks, so a doctor having a free slot
+        soon costs a single day of computation.
+        """
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        since = max(since, now.date())
+        until = min(until, self.__schedule_until.date())
+
+        async def iter_slots() -> t.AsyncIterator[Interval]:
+            chunk_since = since
+            chunk_days = 1
+            while chunk_since <= until:
+                chunk_until = min(
+                    chunk_since + dt.timedelta(days=chunk_days - 1), until
+                )
+                intervals = await self.get_free_intervals(
+                    doctor_id=doctor_id,
+                    since=chunk_since,
+                    until=chunk_until,
+                )
+                for slots in intervals.values():
+                    for slot in slots:
+                        yield slot
+                chunk_since = chunk_until + dt.timedelta(days=1)
+                chunk_days = min(chunk_days * 2, EARLIEST_SLOTS_MAX_CHUNK_DAYS)
+
+        slots = iter_slots()
+        try:
+            async for interval in self.__iter_fitting_intervals(slots, duration, now):
+                yield interval
+        finally:
+            await slots.aclose()
+
+    async def find_earliest_slots(
+        self,
+        doctor_ids: t.Iterable[int],
+        duration: dt.timedelta,
+        since: dt.date,
+        until: dt.date,
+        limit: int = 1,
+    ) -> list[DoctorSlot]:
+        """Finds the first free intervals of duration among many doctors.
+
+        Free intervals of every doctor are produced lazily and merged with
+        a heap, the search stops as soon as limit intervals are found.
+        Doctors whose sessions cannot last for duration are skipped.
+        """
+        doctors = await self.__doctor_repo.get_many_by_ids(doctor_ids)
+        streams = {
+            doctor.id: self.__iter_doctor_slots(
+                doctor_id=doctor.id,
+                since=since,
+                until=until,
+                duration=duration,
+            )
+            for doctor in doctors.values()
+            if doctor.max_session_duration >= duration
+        }
+        heap: list[tuple[dt.datetime, int, Interval]] = []
+
+        async def push_next(doctor_id: int) -> None:
+            interval = await anext(streams[doctor_id], None)
+            if interval is not None:
+                heapq.heappush(heap, (interval["start_at"], doctor_id, interval))
+
+        try:
+            for doctor_id in streams:
+                await push_next(doctor_id)
+            slots: list[DoctorSlot] = []
+            while heap and len(slots) < limit:
+                _, doctor_id, interval = heapq.heappop(heap)
+                slots.append(
+                    DoctorSlot(
+                        doctor_id=doctor_id,
+                        start_at=interval["start_at"],
+                        end_at=interval["end_at"],
+                    )
+                )
+                await push_next(doctor_id)
+            return slots
+        finally:
+            for stream in streams.values():
+                await stream.aclose()
@@ -0,0 +1,112 @@
+import asyncio
+from collections import defaultdict
+
+from exceptions import (
+    DoctorNotFoundError,
+    SelectedDateIsExceededError,
+    SelectedScheduleIsNotAvailableError,
+)
+from src.core.config import settings
+from src.core.db import sessionmanager
+from src.schemas.appointment import (
+    AppointmentInDB,
+    BulkItemStatus,
+    CreateAppointment,
+)
+from src.service.appointments import AppointmentService
+from src.service.locks import lock_doctors
+
+BULK_STATUS_ERRORS = {
+    BulkItemStatus.doctor_not_found: DoctorNotFoundError,
+    BulkItemStatus.date_exceeded: SelectedDateIsExceededError,
+    BulkItemStatus.not_available: SelectedScheduleIsNotAvailableError,
+}
+
+
+class BookingCoalescer:
+    """Creates bookings arriving within a short window in one transaction.
+
+    Gathered bookings go through AppointmentService.create_appointments_bulk,
+    which checks the whole batch with one conflict query and resolves
+    conflicts inside it in order of arrival, and are committed once. Each
+    caller gets its own rule or the error create_appointment would raise,
+    when the whole batch fails its items are retried one by one.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[CreateAppointment, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def create_appointment(self, data: CreateAppointment) -> AppointmentInDB:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # The batch is committed even if the caller goes away.
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @classmethod
+    async def _process(cls, batch: list[tuple[CreateAppointment, asyncio.Future]]):
+        items = [data for data, _ in batch]
+        try:
+            async with sessionmanager.session() as db:
+                async with lock_doctors(db, (item.doctor_id for item in items)):
+                    results = await AppointmentService(db=db).create_appointments_bulk(
+                        items=items
+                    )
+                    await db.commit()
+        except Exception as exc:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            # A single item, e.g. one losing a race to a concurrent booking,
+            # fails the whole batch, so every item is retried on its own.
+            # Doctors are retried concurrently, their items in arrival order.
+            by_doctor: dict[int, list] = defaultdict(list)
+            for data, future in batch:
+                by_doctor[data.doctor_id].append((data, future))
+            await asyncio.gather(
+                *(cls._process_one_by_one(entries) for entries in by_doctor.values())
+            )
+            return
+        for result, (_, future) in zip(results, batch):
+            if future.done():
+                continue
+            if result.status == BulkItemStatus.created:
+                future.set_result(result.appointment)
+            else:
+                future.set_exception(BULK_STATUS_ERRORS[result.status]())
+
+    @classmethod
+    async def _process_one_by_one(
+        cls,
+        batch: list[tuple[CreateAppointment, asyncio.Future]],
+    ) -> None:
+        for entry in batch:
+            await cls._process([entry])
+
+
+booking_coalescer: BookingCoalescer | None = None
+if settings.BOOKING_COALESCE_WINDOW_MS > 0:
+    booking_coalescer = BookingCoalescer(
+        window=settings.BOOKING_COALESCE_WINDOW_MS / 1000,
+        max_batch=settings.BOOKING_COALESCE_MAX_BATCH,
+    )
@@ -1,6 +1,11 @@
 from exceptions import DoctorNotFoundError
-from repo.doctors import DoctorRepo
-from src.schemas.doctors import CreateDoctor, DoctorInDB
+from src.repo.doctors import DoctorRepo
+from src.schemas.doctors import (
+    CreateDoctor,
+    DoctorFilter,
+    DoctorInDB,
+    DoctorListItem,
+)
 from src.service.base import ServiceBase
 
 
@@ -23,5 +28,14 @@ class DoctorService(ServiceBase):
             raise DoctorNotFoundError
         return doctor
 
-    async def list_doctors(self) -> list[DoctorInDB]:
-        return await self.__doctor_repo.list_doctors()
+    async def list_doctors(
+        self,
+        after_id: int | None = None,
+        limit: int = 50,
+        filters: DoctorFilter | None = None,
+    ) -> list[DoctorListItem]:
+        return await self.__doctor_repo.list_doctors(
+            after_id=after_id,
+            limit=limit,
+            filters=filters,
+        )
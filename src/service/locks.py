@@ -0,0 +1,117 @@
+import asyncio
+import contextlib
+import random
+import time
+import typing as t
+import weakref
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exceptions import BookingLockTimeoutError
+from src.core import metrics
+from src.core.config import settings
+
+# First key of the two-key advisory locks taken for doctor bookings.
+BOOKING_LOCK_NAMESPACE = 1
+MAX_RETRY_DELAY = 0.5
+
+_local_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+async def _acquire_advisory(
+    db: AsyncSession,
+    doctor_id: int,
+    deadline: float,
+) -> None:
+    delay = settings.BOOKING_LOCK_RETRY_DELAY
+    while True:
+        is_locked = await db.scalar(
+            select(func.pg_try_advisory_xact_lock(BOOKING_LOCK_NAMESPACE, doctor_id))
+        )
+        if is_locked:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise BookingLockTimeoutError
+        # Jitter keeps competing requests from retrying in lockstep.
+        await asyncio.sleep(min(delay * random.uniform(0.5, 1), remaining))
+        delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+async def _acquire_local(doctor_id: int, deadline: float) -> asyncio.Lock:
+    lock = _local_locks.get(doctor_id)
+    if lock is None:
+        lock = _local_locks[doctor_id] = asyncio.Lock()
+    # wait_for may time out after the acquire succeeded and leak the lock,
+    # here the acquire runs in this task and a late success is released.
+    acquired = False
+    try:
+        async with asyncio.timeout(max(deadline - time.monotonic(), 0)):
+            acquired = await lock.acquire()
+    except TimeoutError as exc:
+        if acquired:
+            lock.release()
+        raise BookingLockTimeoutError from exc
+    return lock
+
+
+@contextlib.asynccontextmanager
+async def lock_doctors(
+    db: AsyncSession,
+    doctor_ids: t.Iterable[int],
+) -> t.AsyncIterator[None]:
+    """Serializes bookings of the doctors, others proceed in parallel.
+
+    The block is expected to check, insert and commit. Advisory locks are
+    held by the transaction of db until its commit or rollback, local ones
+    until the block exits. Doctors are locked in id order, so overlapping
+    bulk bookings cannot deadlock, and BookingLockTimeoutError is raised
+    if the locks are not acquired within BOOKING_LOCK_TIMEOUT.
+    """
+    started_at = time.monotonic()
+    deadline = started_at + settings.BOOKING_LOCK_TIMEOUT
+    held: list[asyncio.Lock] = []
+    try:
+        try:
+            for doctor_id in sorted(set(doctor_ids)):
+                if settings.BOOKING_LOCK == "local":
+                    held.append(await _acquire_local(doctor_id, deadline))
+                else:
+                    await _acquire_advisory(db, doctor_id, deadline)
+        finally:
+            metrics.booking_lock_wait.observe(
+                time.monotonic() - started_at,
+                backend=settings.BOOKING_LOCK,
+            )
+        yield
+    finally:
+        for lock in reversed(held):
+            lock.release()
+
+
+@contextlib.asynccontextmanager
+async def try_lock_doctor(db: AsyncSession, doctor_id: int) -> t.AsyncIterator[bool]:
+    """Locks bookings of the doctor only if nobody holds the lock already.
+
+    Yields whether the lock was acquired, it is held like by lock_doctors.
+    Background jobs use it to never make bookings wait.
+    """
+    if settings.BOOKING_LOCK == "advisory":
+        yield await db.scalar(
+            select(func.pg_try_advisory_xact_lock(BOOKING_LOCK_NAMESPACE, doctor_id))
+        )
+        return
+    lock = _local_locks.get(doctor_id)
+    if lock is None:
+        lock = _local_locks[doctor_id] = asyncio.Lock()
+    if lock.locked():
+        yield False
+        return
+    await lock.acquire()
+    try:
+        yield True
+    finally:
+        lock.release()
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import datetime as dt
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.db import sessionmanager
+from src.service.appointments import AppointmentService
+from src.service.locks import try_lock_doctor
+from src.service.partitions import PartitionService
+
+logger = logging.getLogger(__name__)
+
+# First key of the advisory lock electing the worker which materializes,
+# apart from the namespace of booking locks.
+MATERIALIZER_LOCK_NAMESPACE = 2
+
+
+class AppointmentMaterializer:
+    """Keeps occurrences of recurring rules stored as the horizon moves.
+
+    Every interval seconds a worker creates upcoming partitions of
+    appointments and extends the rules lagging behind the horizon by chunk
+    at a time. Batches of doctors run with a pause in between, each on a
+    single connection holding a session-level advisory lock, so a worker
+    or command finding it taken leaves the pass to the other one. Rules of
+    a doctor are committed in their own transaction under the booking lock
+    of the doctor, which is only tried, so doctors being booked are skipped
+    until the next pass instead of making bookings wait.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        batch_size: int,
+        chunk: dt.timedelta,
+        batch_delay: float,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.chunk = chunk
+        self.batch_delay = batch_delay
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.materialize()
+            except Exception:
+                # The next pass resumes from the last committed batch.
+                logger.exception("Materializing appointments failed")
+            await asyncio.sleep(self.interval)
+
+    async def materialize(self) -> int:
+        """Runs one pass unless another worker does, returns processed rules."""
+        processed = 0
+        # Occurrences up to the horizon need partitions to go to.
+        async with sessionmanager.session() as db:
+            await PartitionService(db=db).ensure_partitions()
+            await db.commit()
+        while True:
+            async with sessionmanager.pinned_session() as db:
+                is_locked = await db.scalar(
+                    select(func.pg_try_advisory_lock(MATERIALIZER_LOCK_NAMESPACE, 0))
+                )
+                if not is_locked:
+                    return processed
+                try:
+                    batch = await self._materialize_batch(db)
+                finally:
+                    await db.rollback()
+                    await db.execute(
+                        select(func.pg_advisory_unlock(MATERIALIZER_LOCK_NAMESPACE, 0))
+                    )
+                    await db.commit()
+            processed += batch
+            # Rules lagging by more than chunk are listed again, doctors busy
+            # with bookings are left to the next pass.
+            if batch == 0:
+                return processed
+            await asyncio.sleep(self.batch_delay)
+
+    async def _materialize_batch(self, db: AsyncSession) -> int:
+        """Materializes rules of a batch of doctors, one transaction each.
+
+        Returns a number of processed rules.
+        """
+        service = AppointmentService(db=db)
+        doctor_ids = await service.list_doctors_to_materialize(limit=self.batch_size)
+        await db.commit()
+        processed = 0
+        for doctor_id in doctor_ids:
+            async with try_lock_doctor(db, doctor_id) as is_locked:
+                if is_locked:
+                    processed += await service.materialize_appointments(
+                        doctor_id=doctor_id,
+                        chunk=self.chunk,
+                    )
+                await db.commit()
+        return processed
+
+
+appointment_materializer: AppointmentMaterializer | None = None
+if settings.APPOINTMENT_MATERIALIZER_INTERVAL > 0:
+    appointment_materializer = AppointmentMaterializer(
+        interval=settings.APPOINTMENT_MATERIALIZER_INTERVAL,
+        batch_size=settings.APPOINTMENT_MATERIALIZER_BATCH_SIZE,
+        chunk=dt.timedelta(days=settings.APPOINTMENT_MATERIALIZER_CHUNK_DAYS),
+        batch_delay=settings.APPOINTMENT_MATERIALIZER_BATCH_DELAY,
+    )
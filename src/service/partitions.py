@@ -0,0 +1,69 @@
+import datetime as dt
+
+from sqlalchemy import func, select
+
+from src.core.config import settings
+from src.repo.partitions import AppointmentPartitionRepo
+from src.service.base import ServiceBase
+from src.utils.recurrence import iter_months
+
+# First key of the advisory lock serializing partition maintenance,
+# apart from the namespaces of booking locks and the materializer.
+PARTITION_LOCK_NAMESPACE = 3
+
+
+class PartitionService(ServiceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(PartitionService, self).__init__(*args, **kwargs)
+        self.__partition_repo = AppointmentPartitionRepo(db=self._db)
+
+    async def __lock(self) -> None:
+        await self._db.execute(
+            select(func.pg_advisory_xact_lock(PARTITION_LOCK_NAMESPACE, 0))
+        )
+
+    async def ensure_partitions(self, until: dt.date | None = None) -> list[dt.date]:
+        """Creates missing partitions from this month through until's one.
+
+        By default until is APPOINTMENT_PARTITION_MONTHS_AHEAD months past
+        the booking horizon. Returns months of created partitions.
+        """
+        today = dt.datetime.now(tz=dt.timezone.utc).date()
+        if until is None:
+            until = today + dt.timedelta(
+                days=settings.SCHEDULE_FOR_DAYS
+                + 31 * settings.APPOINTMENT_PARTITION_MONTHS_AHEAD
+            )
+        await self.__lock()
+        existing = set(await self.__partition_repo.list_partitions())
+        created = []
+        for year, month in iter_months(today.year, today.month):
+            if (year, month) > (until.year, until.month):
+                break
+            month = dt.date(year, month, 1)
+            if month not in existing:
+                await self.__partition_repo.create_partition(month)
+                created.append(month)
+        return created
+
+    async def detach_partitions(
+        self,
+        before: dt.date,
+        drop: bool = False,
+    ) -> list[str]:
+        """Detaches partitions of months ending before the date.
+
+        Detached partitions stay as standalone tables to be archived, with
+        drop they are deleted right away. Returns names of the tables.
+        """
+        await self.__lock()
+        names = []
+        for month in await self.__partition_repo.list_partitions():
+            if (month + dt.timedelta(days=31)).replace(day=1) > before:
+                break
+            name = await self.__partition_repo.detach_partition(month)
+            if drop is True:
+                await self.__partition_repo.drop_table(name)
+            names.append(name)
+        return names
@@ -0,0 +1,52 @@
+import time
+import typing as t
+from collections import OrderedDict
+
+K = t.TypeVar("K", bound=t.Hashable)
+V = t.TypeVar("V")
+
+
+class TTLCache(t.Generic[K, V]):
+    """In-process mapping with LRU eviction and per-entry expiration.
+
+    Entries live for ``ttl`` seconds at most, and the least recently used
+    entry is evicted once ``maxsize`` is reached. The cache is local to the
+    worker process and is not meant to be shared between event loops.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def delete_many(self, keys: t.Iterable[K]) -> None:
+        for key in keys:
+            self.delete(key)
+
+    def clear(self) -> None:
+        self._data.clear()
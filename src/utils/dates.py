@@ -12,3 +12,20 @@ def iterate_between_dates(
     while current_date <= end_date:
         yield current_date
         current_date += dt.timedelta(days=1)
+
+
+def to_naive_utc(value: dt.datetime) -> dt.datetime:
+    """Converts datetime to naive UTC as stored in `timestamp` columns."""
+    if value.tzinfo is dt.timezone.utc:
+        # Fast path for the values produced by the service layer.
+        return value.replace(tzinfo=None)
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_aware_utc(value: dt.datetime) -> dt.datetime:
+    """Converts naive UTC datetime loaded from database to aware one."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return value
@@ -0,0 +1,164 @@
+"""Occurrences of appointment rules computed in closed form.
+
+Each occurrence is derived from the rule and the month or week it falls
+in, so producing the occurrences of a window costs O(occurrences) no
+matter how far the window is from the rule start date.
+"""
+
+import calendar
+import datetime as dt
+import itertools
+import typing as t
+
+from src.schemas.appointment import (
+    AppointmentDate,
+    AppointmentInDB,
+    CreateAppointment,
+    ScheduleType,
+)
+
+Rule = CreateAppointment | AppointmentInDB
+
+ONE_WEEK = dt.timedelta(weeks=1)
+MAX_WEEK_NUMBER = 5
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date | None:
+    """Returns the n-th given weekday of the month or None if there is none."""
+    first_weekday, month_days = calendar.monthrange(year, month)
+    day = 1 + (weekday - first_weekday) % 7 + (n - 1) * 7
+    if day > month_days:
+        return None
+    return dt.date(year, month, day)
+
+
+def clamped_day(year: int, month: int, day: int) -> dt.date:
+    """Returns the day of the month, or its last day for shorter months."""
+    _, month_days = calendar.monthrange(year, month)
+    return dt.date(year, month, min(day, month_days))
+
+
+def iter_months(year: int, month: int) -> t.Iterator[tuple[int, int]]:
+    """Yields (year, month) pairs starting with the given one, endlessly."""
+    while True:
+        yield year, month
+        if month == 12:
+            year, month = year + 1, 1
+        else:
+            month += 1
+
+
+def _occurrence(rule: Rule, date: dt.date) -> AppointmentDate:
+    start_at = dt.datetime.combine(date, rule.start_at, tzinfo=dt.timezone.utc)
+    return AppointmentDate(start_at=start_at, end_at=start_at + rule.duration)
+
+
+def _iter_sole(rule: Rule, since: dt.datetime) -> t.Iterator[AppointmentDate]:
+    yield _occurrence(rule, rule.date)
+
+
+def _iter_weekday(rule: Rule, since: dt.datetime) -> t.Iterator[AppointmentDate]:
+    first = _occurrence(rule, rule.date)
+    # Whole weeks to skip to reach since, rounded up.
+    weeks = max(-((first.start_at - since) // ONE_WEEK), 0)
+    start_at = first.start_at + ONE_WEEK * weeks
+    while True:
+        yield AppointmentDate(start_at=start_at, end_at=start_at + rule.duration)
+        start_at += ONE_WEEK
+
+
+def _iter_monthly(rule: Rule, since: dt.datetime) -> t.Iterator[AppointmentDate]:
+    if not 1 <= rule.day_of_month <= 31:
+        return
+    months = iter_months(rule.date.year, rule.date.month)
+    if rule.date.day > rule.day_of_month:
+        # This month's day has passed, the rule starts next month.
+        next(months)
+    months = _skip_months_before(months, since)
+    for year, month in months:
+        yield _occurrence(rule, clamped_day(year, month, rule.day_of_month))
+
+
+def _iter_monthly_weekday(
+    rule: Rule,
+    since: dt.datetime,
+) -> t.Iterator[AppointmentDate]:
+    if not 1 <= rule.week_number <= MAX_WEEK_NUMBER:
+        return
+    months = iter_months(rule.date.year, rule.date.month)
+    for year, month in _skip_months_before(months, since):
+        date = nth_weekday(year, month, rule.day_of_week, rule.week_number)
+        if date is not None and date >= rule.date:
+            yield _occurrence(rule, date)
+
+
+def _skip_months_before(
+    months: t.Iterator[tuple[int, int]],
+    since: dt.datetime,
+) -> t.Iterator[tuple[int, int]]:
+    """Jumps straight to the month of since when it comes later.
+
+    Occurrences of earlier months start before since, the ones of the
+    month of since are filtered by the caller.
+    """
+    first = next(months)
+    if (since.year, since.month) > first:
+        return iter_months(since.year, since.month)
+    return itertools.chain([first], months)
+
+
+def iter_occurrences(
+    rule: Rule,
+    since: dt.datetime = dt.datetime.min.replace(tzinfo=dt.timezone.utc),
+) -> t.Iterator[AppointmentDate]:
+    """Yields occurrences of the rule starting at since or later.
+
+    Occurrences come in chronological order, endlessly except for sole
+    rules, rules that can never occur yield nothing.
+    """
+    match rule.schedule_type:
+        case ScheduleType.sole:
+            occurrences = _iter_sole(rule, since)
+        case ScheduleType.weekday:
+            occurrences = _iter_weekday(rule, since)
+        case ScheduleType.monthly:
+            occurrences = _iter_monthly(rule, since)
+        case ScheduleType.monthly_weekday:
+            occurrences = _iter_monthly_weekday(rule, since)
+        case _ as unreachable:
+            t.assert_never(unreachable)
+    return itertools.dropwhile(
+        lambda occurrence: occurrence.start_at < since,
+        occurrences,
+    )
+
+
+def iter_occurrences_between(
+    rule: Rule,
+    since: dt.datetime,
+    until: dt.datetime,
+) -> t.Iterator[AppointmentDate]:
+    """Yields occurrences of the rule starting within [since, until)."""
+    return itertools.takewhile(
+        lambda occurrence: occurrence.start_at < until,
+        iter_occurrences(rule, since),
+    )
+
+
+def has_intersections(
+    first: t.Sequence[AppointmentDate],
+    second: t.Sequence[AppointmentDate],
+) -> bool:
+    """Checks two sorted sequences of disjoint appointments for overlaps."""
+    i = j = 0
+    while i < len(first) and j < len(second):
+        if (
+            first[i].start_at < second[j].end_at
+            and second[j].start_at < first[i].end_at
+        ):
+            return True
+        if first[i].end_at <= second[j].end_at:
+            i += 1
+        else:
+            j += 1
+    return False
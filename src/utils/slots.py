@@ -0,0 +1,206 @@
+import datetime as dt
+import functools
+import itertools
+import typing as t
+from collections import defaultdict
+
+from src.schemas.appointment import Interval
+from src.utils.dates import iterate_between_dates
+
+SLOT_DURATION = dt.timedelta(minutes=15)
+
+
+def get_day_bounds(
+    date: dt.date,
+    available_start_at: dt.time,
+    available_end_at: dt.time,
+) -> tuple[dt.datetime, dt.datetime]:
+    """Returns UTC working bounds of a day, which may end on the next day."""
+    start_at = dt.datetime.combine(
+        date=date,
+        time=available_start_at,
+        tzinfo=dt.timezone.utc,
+    )
+    end_at = dt.datetime.combine(
+        date=date,
+        time=available_end_at,
+        tzinfo=dt.timezone.utc,
+    )
+    if available_end_at <= available_start_at:
+        # In case of next day in UTC timezone.
+        end_at += dt.timedelta(days=1)
+    return start_at, end_at
+
+
+@functools.lru_cache(maxsize=1024)
+def get_day_grid(
+    available_start_at: dt.time,
+    available_end_at: dt.time,
+    step: dt.timedelta,
+) -> tuple[dt.timedelta, tuple[dt.timedelta, ...]]:
+    """Returns the slot grid of working hours, which is the same every day.
+
+    The grid is the offset of working hours from midnight and offsets of
+    slot bounds from their start, one more than there are slots.
+    """
+    start_at, end_at = get_day_bounds(dt.date.min, available_start_at, available_end_at)
+    width = max(-((start_at - end_at) // step), 0)
+    return (
+        start_at - dt.datetime.combine(dt.date.min, dt.time.min, dt.timezone.utc),
+        tuple(step * index for index in range(width + 1)),
+    )
+
+
+def calculate_slots(
+    date: dt.date,
+    available_start_at: dt.time,
+    available_end_at: dt.time,
+    scheduled: t.Iterable[Interval],
+    step: dt.timedelta = SLOT_DURATION,
+) -> list[Interval]:
+    """Returns free slots of the working day left by scheduled intervals."""
+    bitmap = DayBitmap.for_day(
+        date=date,
+        available_start_at=available_start_at,
+        available_end_at=available_end_at,
+        step=step,
+    )
+    for appointment in scheduled:
+        bitmap.mark_busy(appointment["start_at"], appointment["end_at"])
+    return list(bitmap.iter_free())
+
+
+def split_ranges_by_intervals(
+    since: dt.date,
+    until: dt.date,
+    available_start_at: dt.time,
+    available_end_at: dt.time,
+    appointments: t.Mapping[dt.date, list[Interval]],
+    step: dt.timedelta = SLOT_DURATION,
+) -> dict[dt.date, list[Interval]]:
+    """Returns free slots of every day of [since, until].
+
+    appointments are scheduled intervals grouped by the date they start on.
+    """
+    appointments = defaultdict(list, appointments)
+    intervals: dict[dt.date, list[Interval]] = {}
+    one_day = dt.timedelta(days=1)
+    for date in iterate_between_dates(since, until):
+        # Neighbour days are included for shifts and appointments
+        # crossing midnight, the bitmap clips them to working hours.
+        intervals[date] = calculate_slots(
+            date=date,
+            available_start_at=available_start_at,
+            available_end_at=available_end_at,
+            scheduled=itertools.chain(
+                appointments[date - one_day],
+                appointments[date],
+                appointments[date + one_day],
+            ),
+            step=step,
+        )
+    return intervals
+
+
+def merge_intervals(
+    intervals: t.Iterable[Interval],
+    min_duration: dt.timedelta,
+    end_at: dt.datetime,
+) -> list[Interval]:
+    """Merges chronologically ordered contiguous intervals into runs.
+
+    Runs are clipped to end_at, the end of working hours which the last
+    slot may run past, and runs shorter than min_duration are dropped.
+    """
+    runs: list[Interval] = []
+    for interval in intervals:
+        if runs and runs[-1]["end_at"] == interval["start_at"]:
+            runs[-1] = {"start_at": runs[-1]["start_at"], "end_at": interval["end_at"]}
+        else:
+            runs.append(interval)
+    clipped: list[Interval] = [
+        {"start_at": run["start_at"], "end_at": min(run["end_at"], end_at)}
+        for run in runs
+    ]
+    return [run for run in clipped if run["end_at"] - run["start_at"] >= min_duration]
+
+
+class DayBitmap:
+    """Working day of a doctor as an integer bitmap of fixed-width slots.
+
+    Bit ``i`` stands for the slot starting ``i * step`` after ``start_at``,
+    a set bit means that the slot is busy. Marking appointments is a single
+    OR of a precomputed run of bits, free slots are read back with bitwise
+    operations instead of walking the day slot by slot.
+    """
+
+    __slots__ = ("start_at", "step", "width", "busy", "offsets")
+
+    def __init__(
+        self,
+        start_at: dt.datetime,
+        end_at: dt.datetime,
+        step: dt.timedelta = SLOT_DURATION,
+    ):
+        self.start_at = start_at
+        self.step = step
+        # The last slot may run past the end of working hours.
+        self.width = max(-((start_at - end_at) // step), 0)
+        self.busy = 0
+        self.offsets: t.Sequence[dt.timedelta] | None = None
+
+    @classmethod
+    def for_day(
+        cls,
+        date: dt.date,
+        available_start_at: dt.time,
+        available_end_at: dt.time,
+        step: dt.timedelta = SLOT_DURATION,
+    ) -> "DayBitmap":
+        """Creates the bitmap of a day from the cached grid of working hours."""
+        start_offset, offsets = get_day_grid(
+            available_start_at,
+            available_end_at,
+            step,
+        )
+        bitmap = cls.__new__(cls)
+        bitmap.start_at = (
+            dt.datetime.combine(date, dt.time.min, dt.timezone.utc) + start_offset
+        )
+        bitmap.step = step
+        bitmap.width = len(offsets) - 1
+        bitmap.busy = 0
+        bitmap.offsets = offsets
+        return bitmap
+
+    @property
+    def mask(self) -> int:
+        return (1 << self.width) - 1
+
+    @property
+    def free(self) -> int:
+        return ~self.busy & self.mask
+
+    def mark_busy(self, start_at: dt.datetime, end_at: dt.datetime) -> None:
+        """Marks every slot overlapping ``[start_at, end_at)`` as busy."""
+        first = max((start_at - self.start_at) // self.step, 0)
+        last = min(-((self.start_at - end_at) // self.step), self.width)
+        if first < last:
+            self.busy |= ((1 << (last - first)) - 1) << first
+
+    def iter_free_indexes(self) -> t.Iterator[int]:
+        free = self.free
+        while free:
+            lowest = free & -free
+            yield lowest.bit_length() - 1
+            free ^= lowest
+
+    def iter_free(self) -> t.Iterator[Interval]:
+        offsets = self.offsets
+        if offsets is None:
+            offsets = [self.step * index for index in range(self.width + 1)]
+        for index in self.iter_free_indexes():
+            yield {
+                "start_at": self.start_at + offsets[index],
+                "end_at": self.start_at + offsets[index + 1],
+            }
@@ -0,0 +1,17 @@
+import os
+
+# Settings are required at import time, none of them is used to connect.
+for name, value in {
+    "APP_NAME": "tests",
+    "APP_HOST": "127.0.0.1",
+    "APP_PORT": "8000",
+    "APP_WORKERS": "1",
+    "POSTGRES_USER": "tests",
+    "POSTGRES_PASSWORD": "tests",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_HOST": "127.0.0.1",
+    "POSTGRES_DB": "tests",
+    "POSTGRES_ECHO": "0",
+    "SCHEDULE_FOR_DAYS": "365",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,56 @@
+import types
+
+import pytest
+
+from src.utils import cache
+from src.utils.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(
+        cache, "time", types.SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=5)
+    entries.set("a", 1)
+
+    clock.now = 4.9
+    assert entries.get("a") == 1
+    clock.now = 5
+    assert entries.get("a") is None
+    assert len(entries) == 0
+
+
+def test_setting_again_restarts_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=5)
+    entries.set("a", 1)
+    clock.now = 4
+    entries.set("a", 2)
+
+    clock.now = 8
+    assert entries.get("a") == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    entries = TTLCache(maxsize=2, ttl=5)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    # Reading refreshes the entry, so the next set evicts "b".
+    assert entries.get("a") == 1
+    entries.set("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+
+def test_zero_maxsize_disables_cache(clock):
+    entries = TTLCache(maxsize=0, ttl=5)
+    entries.set("a", 1)
+
+    assert entries.get("a", "missing") == "missing"
@@ -0,0 +1,82 @@
+import datetime as dt
+import itertools
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+
+from src.db.models import Doctor
+from src.repo.doctors import DoctorRepo
+from src.schemas.doctors import DoctorFilter
+
+HOURS = range(0, 24, 2)
+
+
+def works_at(start_at: int, end_at: int, hour: float) -> bool:
+    """Reference check of working hours, which may run past midnight."""
+    if start_at == end_at:
+        return True
+    if start_at < end_at:
+        return start_at <= hour <= end_at
+    return hour >= start_at or hour <= end_at
+
+
+def window(since: int, until: int) -> list[float]:
+    """Half hours of [since, until], wrapping past midnight."""
+    hours = [hour / 2 for hour in range(48)]
+    if since <= until:
+        return [hour for hour in hours if since <= hour <= until]
+    return [hour for hour in hours if hour >= since or hour <= until]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    # Only the filtered columns are needed, times compare as ISO strings.
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE doctors (id INTEGER PRIMARY KEY, "
+                "available_time_start TIME, available_time_end TIME)"
+            )
+        )
+        shifts = list(itertools.product(HOURS, HOURS))
+        connection.execute(
+            insert(Doctor.__table__),
+            [
+                {
+                    "id": id,
+                    "available_time_start": dt.time(start_at),
+                    "available_time_end": dt.time(end_at),
+                }
+                for id, (start_at, end_at) in enumerate(shifts)
+            ],
+        )
+        yield connection, shifts
+
+
+@pytest.mark.parametrize("since, until", list(itertools.product(HOURS, HOURS)))
+def test_doctors_working_whole_window(connection, since: int, until: int):
+    connection, shifts = connection
+    filters = DoctorFilter(
+        available_from=dt.time(since), available_until=dt.time(until)
+    )
+    conditions = DoctorRepo(db=None)._get_filter_conditions(filters)
+
+    found = set(connection.scalars(select(Doctor.id).where(*conditions)))
+
+    expected = {
+        id
+        for id, (start_at, end_at) in enumerate(shifts)
+        if all(works_at(start_at, end_at, hour) for hour in window(since, until))
+    }
+    assert found == expected
+
+
+def test_round_the_clock_doctor_works_any_window(connection):
+    connection, shifts = connection
+    filters = DoctorFilter(available_from=dt.time(7), available_until=dt.time(9))
+    conditions = DoctorRepo(db=None)._get_filter_conditions(filters)
+
+    found = set(connection.scalars(select(Doctor.id).where(*conditions)))
+
+    assert shifts.index((8, 8)) in found
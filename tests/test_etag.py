@@ -0,0 +1,36 @@
+import datetime as dt
+
+import pytest
+
+from src.api.routes.appointments import _etag_matches, _make_etag
+
+ETAG = _make_etag(1, 3, dt.date(2024, 1, 1), dt.date(2024, 1, 7))
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        ETAG,
+        f"W/{ETAG}",
+        "*",
+        f'"other", {ETAG}',
+        f'W/"other",W/{ETAG}',
+    ],
+)
+def test_matches(if_none_match: str):
+    assert _etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        None,
+        "",
+        '"other"',
+        ETAG.strip('"'),
+        _make_etag(1, 4, dt.date(2024, 1, 1), dt.date(2024, 1, 7)),
+        _make_etag(1, 3, dt.date(2024, 1, 1), dt.date(2024, 1, 8)),
+    ],
+)
+def test_does_not_match(if_none_match: str | None):
+    assert not _etag_matches(if_none_match, ETAG)
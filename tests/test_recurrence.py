@@ -0,0 +1,120 @@
+import calendar
+import datetime as dt
+import random
+
+import pytest
+
+from src.schemas.appointment import (
+    AppointmentDate,
+    CreateAppointment,
+    ScheduleType,
+    WeekDay,
+)
+from src.utils.recurrence import has_intersections, iter_occurrences_between
+
+UTC = dt.timezone.utc
+RULES = 2_000
+
+
+def expand_day_by_day(
+    rule: CreateAppointment,
+    since: dt.datetime,
+    until: dt.datetime,
+) -> list[tuple[dt.datetime, dt.datetime]]:
+    """Reference expansion checking every day from the rule date on."""
+    occurrences = []
+    day = rule.date
+    while day <= until.date():
+        _, month_days = calendar.monthrange(day.year, day.month)
+        match rule.schedule_type:
+            case ScheduleType.sole:
+                matches = day == rule.date
+            case ScheduleType.weekday:
+                matches = (day - rule.date).days % 7 == 0
+            case ScheduleType.monthly:
+                matches = day.day == min(rule.day_of_month, month_days)
+            case ScheduleType.monthly_weekday:
+                matches = (
+                    day.weekday() == rule.day_of_week
+                    and (day.day - 1) // 7 + 1 == rule.week_number
+                )
+        start_at = dt.datetime.combine(day, rule.start_at, tzinfo=UTC)
+        if matches and since <= start_at < until:
+            occurrences.append((start_at, start_at + rule.duration))
+        day += dt.timedelta(days=1)
+    return occurrences
+
+
+def random_rule(rng: random.Random, schedule_type: ScheduleType) -> CreateAppointment:
+    return CreateAppointment(
+        doctor_id=1,
+        patient_name="patient",
+        schedule_type=schedule_type,
+        date=dt.date(2023, 1, 1) + dt.timedelta(days=rng.randrange(3 * 365)),
+        day_of_week=WeekDay(rng.randrange(7)),
+        day_of_month=rng.randint(1, 31),
+        week_number=rng.randint(1, 5),
+        start_at=dt.time(rng.randrange(24), rng.choice((0, 15, 30, 45))),
+        duration=dt.timedelta(minutes=rng.choice((15, 30, 60, 90))),
+    )
+
+
+@pytest.mark.parametrize("schedule_type", list(ScheduleType))
+def test_matches_day_by_day_expansion(schedule_type: ScheduleType):
+    rng = random.Random(schedule_type.value)
+    for _ in range(RULES):
+        rule = random_rule(rng, schedule_type)
+        since = dt.datetime.combine(
+            rule.date + dt.timedelta(days=rng.randint(-60, 400)),
+            dt.time(rng.randrange(24)),
+            tzinfo=UTC,
+        )
+        until = since + dt.timedelta(days=rng.randint(0, 200))
+
+        occurrences = [
+            (occurrence.start_at, occurrence.end_at)
+            for occurrence in iter_occurrences_between(rule, since, until)
+        ]
+
+        assert occurrences == expand_day_by_day(rule, since, until), rule
+
+
+def random_appointments(rng: random.Random) -> list[AppointmentDate]:
+    """Sorted disjoint appointments, a few hours long, within a week."""
+    appointments = []
+    start_at = dt.datetime(2024, 1, 1, tzinfo=UTC)
+    for _ in range(rng.randrange(8)):
+        start_at += dt.timedelta(minutes=rng.randrange(0, 600, 15))
+        end_at = start_at + dt.timedelta(minutes=rng.randrange(15, 240, 15))
+        appointments.append(AppointmentDate(start_at=start_at, end_at=end_at))
+        start_at = end_at
+    return appointments
+
+
+def test_has_intersections_matches_pairwise_check():
+    rng = random.Random(0)
+    for _ in range(RULES):
+        first, second = random_appointments(rng), random_appointments(rng)
+
+        expected = any(
+            a.start_at < b.end_at and b.start_at < a.end_at
+            for a in first
+            for b in second
+        )
+
+        assert has_intersections(first, second) is expected, (first, second)
+
+
+def test_touching_appointments_do_not_intersect():
+    nine, ten, eleven = (
+        dt.datetime(2024, 1, 1, hour, tzinfo=UTC) for hour in (9, 10, 11)
+    )
+
+    assert not has_intersections(
+        [AppointmentDate(start_at=nine, end_at=ten)],
+        [AppointmentDate(start_at=ten, end_at=eleven)],
+    )
+    assert has_intersections(
+        [AppointmentDate(start_at=nine, end_at=eleven)],
+        [AppointmentDate(start_at=ten, end_at=ten + dt.timedelta(minutes=15))],
+    )
@@ -0,0 +1,163 @@
+import datetime as dt
+import random
+
+import pytest
+
+from src.schemas.appointment import Interval
+from src.utils.slots import (
+    DayBitmap,
+    calculate_slots,
+    get_day_bounds,
+    merge_intervals,
+)
+
+UTC = dt.timezone.utc
+DATE = dt.date(2024, 3, 10)
+DAYS = 500
+
+
+def slots_one_by_one(
+    date: dt.date,
+    available_start_at: dt.time,
+    available_end_at: dt.time,
+    scheduled: list[Interval],
+    step: dt.timedelta,
+) -> list[Interval]:
+    """Reference walking working hours slot by slot."""
+    start_at, end_at = get_day_bounds(date, available_start_at, available_end_at)
+    slots = []
+    while start_at < end_at:
+        slot_end_at = start_at + step
+        if not any(
+            appointment["start_at"] < slot_end_at and start_at < appointment["end_at"]
+            for appointment in scheduled
+        ):
+            slots.append({"start_at": start_at, "end_at": slot_end_at})
+        start_at = slot_end_at
+    return slots
+
+
+def random_time(rng: random.Random) -> dt.time:
+    return dt.time(rng.randrange(24), rng.choice((0, 15, 30, 45)))
+
+
+def random_appointment(rng: random.Random, date: dt.date) -> Interval:
+    start_at = dt.datetime.combine(
+        date + dt.timedelta(days=rng.randint(-1, 1)),
+        dt.time(rng.randrange(24), rng.randrange(0, 60, 5)),
+        tzinfo=UTC,
+    )
+    duration = dt.timedelta(minutes=rng.randrange(5, 240, 5))
+    return {"start_at": start_at, "end_at": start_at + duration}
+
+
+def at(hour: int, minute: int = 0, days: int = 0) -> dt.datetime:
+    return dt.datetime.combine(
+        DATE + dt.timedelta(days=days), dt.time(hour, minute), tzinfo=UTC
+    )
+
+
+@pytest.mark.parametrize("step", [15, 20, 60])
+def test_matches_slot_by_slot_reference(step: int):
+    rng = random.Random(step)
+    step = dt.timedelta(minutes=step)
+    for _ in range(DAYS):
+        date = DATE + dt.timedelta(days=rng.randrange(365))
+        available_start_at = random_time(rng)
+        # Same bounds work round the clock, earlier ones past midnight.
+        available_end_at = rng.choice((available_start_at, random_time(rng)))
+        scheduled = [random_appointment(rng, date) for _ in range(rng.randrange(6))]
+
+        slots = calculate_slots(
+            date=date,
+            available_start_at=available_start_at,
+            available_end_at=available_end_at,
+            scheduled=scheduled,
+            step=step,
+        )
+
+        assert slots == slots_one_by_one(
+            date, available_start_at, available_end_at, scheduled, step
+        ), (date, available_start_at, available_end_at, scheduled)
+
+
+def test_overnight_shift_runs_into_next_day():
+    slots = calculate_slots(
+        date=DATE,
+        available_start_at=dt.time(23),
+        available_end_at=dt.time(1),
+        scheduled=[{"start_at": at(23, 30), "end_at": at(0, 30, days=1)}],
+        step=dt.timedelta(minutes=30),
+    )
+
+    assert slots == [
+        {"start_at": at(23), "end_at": at(23, 30)},
+        {"start_at": at(0, 30, days=1), "end_at": at(1, days=1)},
+    ]
+
+
+def test_round_the_clock_shift_lasts_a_day():
+    slots = calculate_slots(
+        date=DATE,
+        available_start_at=dt.time(8),
+        available_end_at=dt.time(8),
+        scheduled=[{"start_at": at(9), "end_at": at(7, days=1)}],
+        step=dt.timedelta(hours=1),
+    )
+
+    assert slots == [
+        {"start_at": at(8), "end_at": at(9)},
+        {"start_at": at(7, days=1), "end_at": at(8, days=1)},
+    ]
+
+
+def test_bitmap_marks_partially_covered_slots():
+    bitmap = DayBitmap(at(9), at(10), step=dt.timedelta(minutes=15))
+    bitmap.mark_busy(at(9, 10), at(9, 20))
+    # Appointments outside working hours are clipped away.
+    bitmap.mark_busy(at(7), at(8))
+    bitmap.mark_busy(at(11), at(12))
+
+    assert list(bitmap.iter_free_indexes()) == [2, 3]
+    assert list(bitmap.iter_free()) == [
+        {"start_at": at(9, 30), "end_at": at(9, 45)},
+        {"start_at": at(9, 45), "end_at": at(10)},
+    ]
+
+
+def test_merge_intervals_joins_runs_and_clips_to_working_hours():
+    step = dt.timedelta(minutes=20)
+    slots = [
+        {"start_at": at(9), "end_at": at(9, 20)},
+        {"start_at": at(9, 20), "end_at": at(9, 40)},
+        {"start_at": at(10), "end_at": at(10, 20)},
+        {"start_at": at(10, 40), "end_at": at(11)},
+        {"start_at": at(11), "end_at": at(11, 20)},
+    ]
+    copied = [dict(slot) for slot in slots]
+
+    runs = merge_intervals(slots, step, end_at=at(11, 10))
+
+    # The last slot runs past working hours and is clipped to them.
+    assert runs == [
+        {"start_at": at(9), "end_at": at(9, 40)},
+        {"start_at": at(10), "end_at": at(10, 20)},
+        {"start_at": at(10, 40), "end_at": at(11, 10)},
+    ]
+    assert slots == copied
+
+
+def test_merge_intervals_drops_short_runs_after_clipping():
+    slots = [
+        {"start_at": at(9), "end_at": at(9, 30)},
+        {"start_at": at(10), "end_at": at(10, 30)},
+        {"start_at": at(10, 30), "end_at": at(11)},
+    ]
+
+    runs = merge_intervals(slots, dt.timedelta(minutes=45), end_at=at(10, 40))
+
+    assert runs == []
+    assert merge_intervals(slots, dt.timedelta(minutes=30), end_at=at(11)) == [
+        {"start_at": at(9), "end_at": at(9, 30)},
+        {"start_at": at(10), "end_at": at(11)},
+    ]